@@ -1,28 +1,9 @@
+# app/bot.py
+# Старая точка входа. Вся сборка бота (миграции, UserMiddleware, хранилище FSM, роутеры,
+# планировщик) — в main.py; отдельная копия здесь расходилась с ней, поэтому просто запускаем его.
 import asyncio
-import os
-from dotenv import load_dotenv
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
-import logging
-logging.basicConfig(level=logging.INFO)
 
-from app.handlers import start, add  # подключаем наш start.py
-
-load_dotenv()
-TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-
-bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher()
-
-# подключаем router из start.py
-dp.include_router(start.router)
-# подключаем router из add.py
-dp.include_router(add.form_router)
-
-
-async def main():
-    await dp.start_polling(bot)
+from main import main
 
 if __name__ == "__main__":
     asyncio.run(main())
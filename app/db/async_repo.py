@@ -0,0 +1,73 @@
+# app/db/async_repo.py
+"""
+Awaitable-версии функций app.db.repo.
+SQL выполняется в отдельном пуле потоков на долгоживущих соединениях,
+поэтому хендлеры и планировщик не блокируют event loop.
+"""
+import functools
+
+from app.db import repo
+from app.db.pool import run_in_db, shutdown_executor
+
+
+def _wrap(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_in_db(fn, *args, **kwargs)
+    return wrapper
+
+
+migrate = _wrap(repo.migrate)
+
+# ---- users ----
+get_or_create_user = _wrap(repo.get_or_create_user)
+update_timezone = _wrap(repo.update_timezone)
+update_username = _wrap(repo.update_username)
+set_quiet_hours = _wrap(repo.set_quiet_hours)
+set_sleep_state = _wrap(repo.set_sleep_state)
+wake_user = _wrap(repo.wake_user)
+is_user_sleeping = _wrap(repo.is_user_sleeping)
+get_user_by_id = _wrap(repo.get_user_by_id)
+
+# ---- tasks ----
+add_task = _wrap(repo.add_task)
+add_tasks = _wrap(repo.add_tasks)
+list_open = _wrap(repo.list_open)
+get_due = _wrap(repo.get_due)
+count_due = _wrap(repo.count_due)
+load_schedule = _wrap(repo.load_schedule)
+mark_done = _wrap(repo.mark_done)
+snooze = _wrap(repo.snooze)
+reschedule = _wrap(repo.reschedule)
+skip_missed = _wrap(repo.skip_missed)
+quiet_hours_settings = _wrap(repo.quiet_hours_settings)
+defer_quiet = _wrap(repo.defer_quiet)
+claim_due = _wrap(repo.claim_due)
+release_leases = _wrap(repo.release_leases)
+set_interval = _wrap(repo.set_interval)
+delete_task = _wrap(repo.delete_task)
+count_open = _wrap(repo.count_open)
+list_open_paged = _wrap(repo.list_open_paged)
+list_open_page = _wrap(repo.list_open_page)
+
+# ---- outbox ----
+enqueue_outbox = _wrap(repo.enqueue_outbox)
+claim_outbox = _wrap(repo.claim_outbox)
+renew_outbox = _wrap(repo.renew_outbox)
+settle_outbox = _wrap(repo.settle_outbox)
+purge_outbox = _wrap(repo.purge_outbox)
+
+# ---- архив ----
+archive_closed = _wrap(repo.archive_closed)
+incremental_vacuum = _wrap(repo.incremental_vacuum)
+
+# ---- состояния FSM ----
+fsm_get = _wrap(repo.fsm_get)
+fsm_write_many = _wrap(repo.fsm_write_many)
+fsm_expire = _wrap(repo.fsm_expire)
+
+
+def close():
+    """Дожидается запросов в полёте и закрывает соединения пула (вызывать при остановке бота)."""
+    shutdown_executor()
+    repo.close_pool()
@@ -0,0 +1,172 @@
+# app/db/fsm_storage.py
+"""
+FSM-хранилище aiogram поверх SQLite (таблица fsm_state) вместо MemoryStorage.
+
+- диалоги (/add) переживают рестарт бота;
+- горячий слой в памяти — LRU не больше max_cached ключей; кэшируется и «диалога нет»,
+  иначе каждый апдейт (FSM-мидлварь спрашивает состояние всегда) ходил бы в БД;
+- запись отложенная: изменения копятся и раз в flush_interval уходят одной транзакцией;
+- диалоги, которые не трогали дольше ttl_seconds, считаются брошенными и выметаются.
+Данные диалога хранятся как JSON — класть в state.update_data можно только JSON-совместимое.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from app.db import async_repo
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 24 * 3600
+
+
+class _Entry:
+    __slots__ = ("state", "data", "updated")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], updated: float):
+        self.state = state
+        self.data = data
+        self.updated = updated
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+def _key(key: StorageKey) -> str:
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny,
+    ))
+
+
+class SqliteStorage(BaseStorage):
+    def __init__(
+        self,
+        ttl_seconds: float = DEFAULT_TTL,
+        max_cached: int = 10_000,
+        flush_interval: float = 1.0,
+        sweep_interval: float = 600.0,
+    ):
+        if max_cached <= 0:
+            raise ValueError("max_cached must be > 0")
+        self.ttl = ttl_seconds
+        self.max_cached = max_cached
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self._cache: OrderedDict[str, _Entry] = OrderedDict()
+        # изменения, ещё не записанные в БД; из кэша ключ может быть уже вытеснен — тогда он только здесь
+        self._dirty: Dict[str, _Entry] = {}
+        # пачка, которая пишется прямо сейчас (чтение не должно проскочить мимо неё в БД)
+        self._flushing: Dict[str, _Entry] = {}
+        self._flusher: Optional[asyncio.Task] = None
+
+    # ---- горячий слой ----
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return not entry.empty and entry.updated < now - self.ttl
+
+    def _remember(self, k: str, entry: _Entry) -> None:
+        self._cache[k] = entry
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def _pending(self, k: str) -> Optional[_Entry]:
+        return self._cache.get(k) or self._dirty.get(k) or self._flushing.get(k)
+
+    async def _lookup(self, key: StorageKey) -> _Entry:
+        k = _key(key)
+        now = time.time()
+        entry = self._pending(k)
+        if entry is None:
+            row = await async_repo.fsm_get(k, now - self.ttl)
+            # пока ждали БД, ключ могли записать — свежее значение важнее прочитанного
+            entry = self._pending(k)
+            if entry is None:
+                if row is None:
+                    entry = _Entry(None, {}, now)
+                else:
+                    entry = _Entry(row["state"], json.loads(row["data"]), row["updated_at"])
+        if self._expired(entry, now):
+            entry = self._write(k, None, {})
+        else:
+            self._remember(k, entry)
+        return entry
+
+    def _write(self, k: str, state: Optional[str], data: Dict[str, Any]) -> _Entry:
+        entry = _Entry(state, data, time.time())
+        self._remember(k, entry)
+        self._dirty[k] = entry
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop(), name="fsm-flush")
+        return entry
+
+    # ---- BaseStorage ----
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._lookup(key)
+        self._write(_key(key), state.state if isinstance(state, State) else state, entry.data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._lookup(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        entry = await self._lookup(key)
+        self._write(_key(key), entry.state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._lookup(key)).data)
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    # ---- запись в БД ----
+    async def flush(self) -> None:
+        """Пишет накопившиеся изменения одной транзакцией."""
+        if not self._dirty:
+            return
+        self._flushing, self._dirty = self._dirty, {}
+        try:
+            upserts = [
+                (k, e.state, json.dumps(e.data, ensure_ascii=False), e.updated)
+                for k, e in self._flushing.items() if not e.empty
+            ]
+            deletes = [k for k, e in self._flushing.items() if e.empty]
+            await async_repo.fsm_write_many(upserts, deletes)
+        except BaseException:
+            # не записалось — вернуть в очередь, не затирая то, что успели изменить после
+            for k, e in self._flushing.items():
+                self._dirty.setdefault(k, e)
+            raise
+        finally:
+            self._flushing = {}
+
+    def _sweep_cache(self, now: float) -> None:
+        for k in [k for k, e in self._cache.items() if self._expired(e, now)]:
+            del self._cache[k]
+
+    async def _flush_loop(self) -> None:
+        swept_at = time.time()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                now = time.time()
+                if now - swept_at >= self.sweep_interval:
+                    swept_at = now
+                    self._sweep_cache(now)
+                    expired = await async_repo.fsm_expire(now - self.ttl)
+                    if expired:
+                        log.info("fsm: dropped %d abandoned dialogs", expired)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("fsm flush failed")
@@ -0,0 +1,247 @@
+# app/db/migrations.py
+"""
+Версионированные миграции схемы.
+
+В таблице schema_version записан каждый применённый шаг; при старте бота (repo.migrate)
+и из `python -m app.db.init_db` применяются те, что новее записанной версии, по порядку,
+каждый в своей транзакции. Новая колонка или индекс — новый шаг в конце MIGRATIONS,
+уже выпущенные шаги не меняются.
+
+Шаги написаны идемпотентно (IF NOT EXISTS, проверка колонки перед ALTER): базы, созданные
+старым init_db без schema_version, проходят все шаги с первого и приходят к той же схеме.
+"""
+import time
+
+# ---- шаги ----
+
+def _add_column(cur, table, column, decl):
+    # table_xinfo, а не table_info: генерируемые колонки table_info не показывает
+    cols = {row[1] for row in cur.execute(f"PRAGMA table_xinfo({table})")}
+    if column not in cols:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _initial(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id                INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_user_id  INTEGER NOT NULL UNIQUE,
+        username          TEXT,                                -- может быть NULL
+        timezone          TEXT DEFAULT 'Europe/Warsaw',
+        created_at        TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at        TEXT DEFAULT CURRENT_TIMESTAMP,
+        is_sleeping       INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    _add_column(cur, "users", "is_sleeping", "INTEGER NOT NULL DEFAULT 0")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS tasks (
+        id               INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id          INTEGER NOT NULL,
+        task_name        TEXT NOT NULL,
+        task_note        TEXT,
+        status           INTEGER NOT NULL DEFAULT 1 CHECK (status IN (0,1)),  -- 1=активна, 0=выполнена/архив
+        next_reminder_at REAL    NOT NULL,                      -- time.time() (UTC, секунды)
+        interval         INTEGER NOT NULL,                      -- минуты
+        paused_until     REAL,                                  -- time.time() или NULL
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """)
+    # /list и выборки по одному пользователю
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_tasks_status_user_time
+    ON tasks(status, user_id, next_reminder_at)
+    """)
+
+
+def _last_sent_at(cur):
+    # когда последнее напоминание реально ушло
+    _add_column(cur, "tasks", "last_sent_at", "REAL")
+
+
+def _task_leases(cur):
+    # какой воркер планировщика сейчас отправляет задачу и до когда действует его захват
+    _add_column(cur, "tasks", "lease_owner", "TEXT")
+    _add_column(cur, "tasks", "lease_until", "REAL")
+
+
+def _outbox(cur):
+    # Очередь отправки напоминаний: pending -> sending -> sent | failed (повторы — обратно в pending).
+    # next_attempt_at: для pending — когда пробовать снова, для sending — до когда действует захват
+    # воркера lease_owner (истёк — строку забирает другой воркер).
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id               INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id          INTEGER NOT NULL,
+        user_id          INTEGER NOT NULL,
+        chat_id          INTEGER NOT NULL,
+        text             TEXT NOT NULL,
+        due_at           REAL NOT NULL,                         -- срок напоминания, к которому относится сообщение
+        state            TEXT NOT NULL DEFAULT 'pending'
+                         CHECK (state IN ('pending','sending','sent','failed')),
+        attempts         INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at  REAL NOT NULL,
+        lease_owner      TEXT,
+        last_error       TEXT,
+        created_at       REAL NOT NULL,
+        sent_at          REAL,
+        FOREIGN KEY (task_id) REFERENCES tasks(id) ON DELETE CASCADE
+    )
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_outbox_state_next
+    ON outbox(state, next_attempt_at)
+    """)
+    # не больше одного неотправленного сообщения на задачу: пока чат лежит, новые сроки не копятся
+    cur.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_open_task
+    ON outbox(task_id) WHERE state IN ('pending','sending')
+    """)
+    # ON DELETE CASCADE ищет сообщения удаляемой задачи — без полного индекса по task_id это скан outbox
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_task ON outbox(task_id)")
+
+
+def _effective_due(cur):
+    # когда задача реально сработает: max(next_reminder_at, paused_until); считает сам SQLite
+    _add_column(cur, "tasks", "effective_due_at",
+                "REAL GENERATED ALWAYS AS (MAX(next_reminder_at, COALESCE(paused_until, 0))) VIRTUAL")
+    # глобальная выборка due планировщика — диапазон по индексу только активных задач
+    # (условие status = 1 должно быть в запросе дословно)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_tasks_active_due
+    ON tasks(effective_due_at) WHERE status = 1
+    """)
+
+
+def _archive(cur):
+    # когда задачу закрыли (выполнена/удалена) — архиватор ждёт grace-период после этого
+    _add_column(cur, "tasks", "closed_at", "REAL")
+    # Закрытые задачи переезжают сюда (services/archiver.py), чтобы tasks и его индексы
+    # росли с числом активных задач, а не со всей историей
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS tasks_archive (
+        id               INTEGER PRIMARY KEY,                   -- тот же id, что был в tasks
+        user_id          INTEGER NOT NULL,
+        task_name        TEXT NOT NULL,
+        task_note        TEXT,
+        status           INTEGER NOT NULL,
+        next_reminder_at REAL NOT NULL,
+        interval         INTEGER NOT NULL,
+        paused_until     REAL,
+        last_sent_at     REAL,
+        closed_at        REAL,
+        archived_at      REAL NOT NULL
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_archive_user ON tasks_archive(user_id)")
+
+
+def _fsm_state(cur):
+    # Состояния диалогов aiogram (FSM, /add) — переживают рестарт бота; см. app/db/fsm_storage.py
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS fsm_state (
+        key        TEXT PRIMARY KEY,                            -- bot:chat:user:thread:business:destiny
+        state      TEXT,
+        data       TEXT NOT NULL DEFAULT '{}',                  -- JSON
+        updated_at REAL NOT NULL
+    )
+    """)
+    # выметание брошенных диалогов по TTL
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_fsm_state_updated ON fsm_state(updated_at)")
+
+
+def _quiet_hours(cur):
+    # Тихие часы пользователя: минуты от локальной полуночи в его timezone, [start, end);
+    # start > end — окно через полночь (23:00–08:00). NULL — тихих часов нет.
+    _add_column(cur, "users", "quiet_start", "INTEGER")
+    _add_column(cur, "users", "quiet_end", "INTEGER")
+    # планировщик каждый тик берёт DISTINCT (timezone, окно) и по нему же join-ит пользователей
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_users_quiet
+    ON users(timezone, quiet_start, quiet_end) WHERE quiet_start IS NOT NULL
+    """)
+
+
+def _parked_tasks(cur):
+    # Задачи спящего пользователя «запаркованы» (1): выборки due их не берут, и тикам не нужно
+    # на каждой строке проверять сон владельца. Ставит/снимает repo.set_sleep_state / wake_user.
+    _add_column(cur, "tasks", "parked", "INTEGER NOT NULL DEFAULT 0")
+    cur.execute("""
+    UPDATE tasks SET parked = 1
+    WHERE status = 1 AND parked = 0
+      AND user_id IN (SELECT id FROM users WHERE is_sleeping = 1)
+    """)
+
+
+def _active_due_unparked(cur):
+    # запаркованные задачи спящих выпадают из индекса: выборка due — чистый диапазон,
+    # без строк, которые тик каждый раз читает и отбрасывает (parked = 0 в запросе тоже дословно)
+    cur.execute("DROP INDEX IF EXISTS idx_tasks_active_due")
+    cur.execute("""
+    CREATE INDEX idx_tasks_active_due
+    ON tasks(effective_due_at) WHERE status = 1 AND parked = 0
+    """)
+
+
+# (версия, описание, функция(cur)); только дописывать в конец
+MIGRATIONS = [
+    (1, "users, tasks", _initial),
+    (2, "tasks.last_sent_at", _last_sent_at),
+    (3, "tasks.lease_owner, tasks.lease_until", _task_leases),
+    (4, "outbox", _outbox),
+    (5, "tasks.effective_due_at + idx_tasks_active_due", _effective_due),
+    (6, "tasks.closed_at, tasks_archive", _archive),
+    (7, "fsm_state", _fsm_state),
+    (8, "users.quiet_start, users.quiet_end", _quiet_hours),
+    (9, "tasks.parked", _parked_tasks),
+    (10, "idx_tasks_active_due without parked tasks", _active_due_unparked),
+]
+
+
+# ---- применение ----
+
+def current_version(conn) -> int:
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version     INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at  REAL NOT NULL
+    )
+    """)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn) -> list[int]:
+    """
+    Применяет недостающие миграции; возвращает номера применённых.
+    Безопасно запускать из нескольких процессов сразу: каждый шаг под BEGIN IMMEDIATE,
+    версия перепроверяется уже под блокировкой записи.
+    """
+    # Оба режима хранятся в самом файле базы — достаточно включить один раз.
+    # auto_vacuum действует, только если задан до первой таблицы: новые базы сразу получают
+    # incremental (место после архивации возвращает archiver), старым нужен разовый
+    # `python -m app.db.init_db --vacuum`.
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= current_version(conn):
+                conn.rollback()
+                continue
+            step(cur)
+            cur.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, time.time()),
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
@@ -0,0 +1,98 @@
+# app/db/pool.py
+import asyncio
+import functools
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Размер пула соединений и число потоков для SQL — одно и то же число,
+# чтобы поток из executor'а никогда не ждал свободного соединения.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+
+class ConnectionPool:
+    """
+    Ограниченный пул долгоживущих sqlite3-соединений.
+    Соединения создаются лениво (не больше size) и переиспользуются между вызовами,
+    вместо sqlite3.connect/close на каждый запрос.
+    """
+
+    def __init__(self, factory, size: int = POOL_SIZE):
+        if size <= 0:
+            raise ValueError("pool size must be > 0")
+        self._factory = factory
+        self._size = size
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float | None = None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self._size:
+                self._created += 1
+                try:
+                    return self._factory()
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        # все соединения заняты — ждём, пока какое-нибудь вернут
+        return self._idle.get(timeout=timeout)
+
+    def release(self, conn) -> None:
+        # незакоммиченное не должно утечь в следующий вызов
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close_all(self) -> None:
+        with self._lock:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
+                self._created -= 1
+
+
+# ---- выполнение SQL вне event loop ----
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="db")
+    return _executor
+
+
+async def run_in_db(fn, *args, **kwargs):
+    """Выполняет синхронную функцию репозитория в потоке БД и ждёт результат."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
@@ -1,48 +1,145 @@
 # app/db/repo.py
+import os
 import sqlite3
 import time
 from pathlib import Path
 
+from app.db import migrations
+from app.db.pool import ConnectionPool
+
 # ---- подключение к БД (абсолютный путь рядом с этим файлом) ----
 DB_PATH = Path(__file__).with_name("database.db")
 
+# Профиль соединения. journal_mode=WAL включает migrate() (хранится в файле базы):
+# читатели (/list, тики) не ждут писателя и наоборот. В WAL synchronous=NORMAL не теряет
+# целостность, только последние транзакции при падении ОС, зато без fsync на каждый commit.
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA temp_store = MEMORY",
+    # страницы читаются через mmap без копирования в кэш sqlite
+    f"PRAGMA mmap_size = {int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+    # отрицательное значение — размер в КиБ, на каждое соединение пула
+    f"PRAGMA cache_size = -{int(os.getenv('DB_CACHE_KB', str(32 * 1024)))}",
+)
+
+
 def get_connection():
-    conn = sqlite3.connect(DB_PATH)
+    # check_same_thread=False: соединение живёт в пуле и используется потоками БД по очереди
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=BUSY_TIMEOUT_MS / 1000)
     conn.row_factory = sqlite3.Row
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
+# Долгоживущие соединения вместо connect/close на каждый вызов
+_pool = ConnectionPool(get_connection)
+
+
+def close_pool():
+    _pool.close_all()
+
+
+def migrate():
+    """Доводит схему базы до актуальной (app/db/migrations.py); возвращает номера применённых миграций."""
+    with _pool.connection() as conn:
+        return migrations.migrate(conn)
+
+
+# ---- подписка на изменения расписания ----
+# Слушатель вызывается как fn(task_id, user_id, due_at) после коммита;
+# due_at — эффективное время срабатывания (max(next_reminder_at, paused_until))
+# или None, если задача больше не активна. Может вызываться из потока БД.
+_listeners = []
+
+
+def add_listener(fn):
+    _listeners.append(fn)
+
+
+def remove_listener(fn):
+    if fn in _listeners:
+        _listeners.remove(fn)
+
+
+def _notify(task_id, user_id, due_at):
+    for fn in _listeners:
+        fn(task_id, user_id, due_at)
+
+
+# Изменения строки users (username, timezone, сон): fn(user_id) после коммита —
+# чтобы кэши пользователей могли сбросить запись.
+_user_listeners = []
+
+
+def add_user_listener(fn):
+    _user_listeners.append(fn)
+
+
+def remove_user_listener(fn):
+    if fn in _user_listeners:
+        _user_listeners.remove(fn)
+
+
+def _notify_user(user_id):
+    for fn in _user_listeners:
+        fn(user_id)
+
+
 # ---- users ----
 def get_or_create_user(telegram_user_id, username=None):
-    conn = get_connection()
-    cur = conn.cursor()
+    with _pool.connection() as conn:
+        cur = conn.cursor()
 
-    cur.execute("SELECT * FROM users WHERE telegram_user_id = ?", (telegram_user_id,))
-    user = cur.fetchone()
-    if user:
-        conn.close()
-        return user
+        cur.execute("SELECT * FROM users WHERE telegram_user_id = ?", (telegram_user_id,))
+        user = cur.fetchone()
+        if user:
+            return user
 
-    cur.execute(
-        "INSERT INTO users (telegram_user_id, username) VALUES (?, ?)",
-        (telegram_user_id, username)
-    )
-    conn.commit()
+        cur.execute(
+            "INSERT INTO users (telegram_user_id, username) VALUES (?, ?)",
+            (telegram_user_id, username)
+        )
+        conn.commit()
 
-    cur.execute("SELECT * FROM users WHERE telegram_user_id = ?", (telegram_user_id,))
-    user = cur.fetchone()
-
-    conn.close()
-    return user
+        cur.execute("SELECT * FROM users WHERE telegram_user_id = ?", (telegram_user_id,))
+        return cur.fetchone()
 
 
 def update_timezone(user_id, tz) -> bool:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET timezone = ? WHERE id = ?", (tz, user_id))
-    conn.commit()
-    ok = (cur.rowcount == 1)
-    conn.close()
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE users SET timezone = ? WHERE id = ?", (tz, user_id))
+        conn.commit()
+        ok = (cur.rowcount == 1)
+
+    _notify_user(user_id)
+    return ok
+
+
+def set_quiet_hours(user_id, start_min, end_min) -> bool:
+    """Тихие часы в минутах от локальной полуночи; start_min=end_min=None — выключить."""
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE users SET quiet_start = ?, quiet_end = ? WHERE id = ?", (start_min, end_min, user_id))
+        conn.commit()
+        ok = (cur.rowcount == 1)
+
+    _notify_user(user_id)
+    return ok
+
+
+def update_username(user_id, username) -> bool:
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE users SET username = ? WHERE id = ?", (username, user_id))
+        conn.commit()
+        ok = (cur.rowcount == 1)
+
+    _notify_user(user_id)
     return ok
 
 
@@ -51,159 +148,397 @@ def update_timezone(user_id, tz) -> bool:
 def add_task(user_id, task_name, task_note, interval_min):
     if not task_name or not str(task_name).strip():
         raise ValueError("task_name is empty")
-    # if interval_min <= 0:
-    #     raise ValueError("interval must be > 0")
-
-    conn = get_connection()
-    cur = conn.cursor()
+    if int(interval_min) <= 0:
+        raise ValueError("interval must be > 0")
 
     next_reminder_at = time.time() + int(interval_min) * 60
     status = 1
     paused_until = None
 
-    cur.execute("""
-        INSERT INTO tasks (user_id, task_name, task_note, interval, status, next_reminder_at, paused_until)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (user_id, task_name.strip(), task_note, interval_min, status, next_reminder_at, paused_until))
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO tasks (user_id, task_name, task_note, interval, status, next_reminder_at, paused_until, parked)
+            VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE((SELECT is_sleeping FROM users WHERE id = ?), 0))
+        """, (user_id, task_name.strip(), task_note, interval_min, status, next_reminder_at, paused_until, user_id))
+        conn.commit()
+        task_id = cur.lastrowid
 
-    conn.commit()
-    task_id = cur.lastrowid
-    conn.close()
+    _notify(task_id, user_id, next_reminder_at)
     return task_id
 
 
+def add_tasks(user_id, items):
+    """
+    Пачка задач одного пользователя (импорт, см. services/task_import.py) одним executemany
+    в одной транзакции. items — (task_name, task_note, interval_min).
+    Возвращает id новых задач в порядке items.
+    """
+    now = time.time()
+    rows = []
+    for task_name, task_note, interval_min in items:
+        if not task_name or not str(task_name).strip():
+            raise ValueError("task_name is empty")
+        if int(interval_min) <= 0:
+            raise ValueError("interval must be > 0")
+        rows.append((user_id, task_name.strip(), task_note, int(interval_min), now + int(interval_min) * 60, user_id))
+    if not rows:
+        return []
+
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.executemany("""
+                INSERT INTO tasks (user_id, task_name, task_note, interval, status, next_reminder_at, parked)
+                VALUES (?, ?, ?, ?, 1, ?, COALESCE((SELECT is_sleeping FROM users WHERE id = ?), 0))
+            """, rows)
+            # lastrowid после executemany не обновляется; под блокировкой записи AUTOINCREMENT
+            # выдаёт пачке id подряд, так что хватает последнего
+            last_id = cur.execute("SELECT last_insert_rowid()").fetchone()[0]
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    ids = list(range(last_id - len(rows) + 1, last_id + 1))
+    for task_id, row in zip(ids, rows):
+        _notify(task_id, user_id, row[4])
+    return ids
+
+
 def list_open(user_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, task_name, task_note, status, next_reminder_at, interval, paused_until
-        FROM tasks
-        WHERE user_id = ? AND status = 1
-        ORDER BY next_reminder_at ASC
-    """, (user_id,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, task_name, task_note, status, next_reminder_at, interval, paused_until
+            FROM tasks
+            WHERE user_id = ? AND status = 1
+            ORDER BY next_reminder_at ASC
+        """, (user_id,))
+        return cur.fetchall()
 
 
+# Следующий срок по сетке задачи: next_reminder_at + k * interval, первый строго позже параметра (now).
+# Расписание не дрейфует на задержку отправки. CAST отбрасывает дробь — для наступивших задач это floor.
+# Питоновский двойник — services.tasks.next_reminder_ts.
+# При interval <= 0 деление даёт NULL (а next_reminder_at NOT NULL): запросы с ним отсекают такие строки.
+_NEXT_SLOT = "next_reminder_at + (CAST((? - next_reminder_at) / (interval * 60) AS INTEGER) + 1) * interval * 60"
+
+
+# Глобальные выборки due прибиты к idx_tasks_active_due (INDEXED BY): без статистики ANALYZE — а в рабочей
+# базе её никто не собирает — планировщик SQLite берёт idx_tasks_status_user_time по одному status
+# и перебирает все активные задачи.
+# Задачи спящих пользователей запаркованы (parked = 1, см. set_sleep_state) и в индекс не входят;
+# status = 1 AND parked = 0 — его условие, в запросе оно должно стоять дословно.
 def get_due(now_ts, limit, user_id=None):
-    """Задачи, срок которых наступил: next_reminder_at <= now и (paused_until IS NULL или <= now)."""
+    """
+    Задачи, срок которых наступил: effective_due_at = max(next_reminder_at, paused_until) <= now.
+    Без user_id задачи спящих пользователей не возвращаются.
+    """
     if limit <= 0:
         return []
 
-    conn = get_connection()
-    cur = conn.cursor()
-    if user_id is not None:
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        if user_id is not None:
+            cur.execute("""
+                SELECT id, user_id, task_name, task_note, status, next_reminder_at, interval, paused_until
+                FROM tasks
+                WHERE user_id = ?
+                  AND status = 1
+                  AND effective_due_at <= ?
+                ORDER BY effective_due_at ASC
+                LIMIT ?
+            """, (user_id, now_ts, int(limit)))
+        else:
+            cur.execute("""
+                SELECT id, user_id, task_name, task_note, status, next_reminder_at, interval, paused_until
+                FROM tasks INDEXED BY idx_tasks_active_due
+                WHERE status = 1
+                  AND parked = 0
+                  AND effective_due_at <= ?
+                ORDER BY effective_due_at ASC
+                LIMIT ?
+            """, (now_ts, int(limit)))
+        return cur.fetchall()
+
+
+def count_due(now_ts) -> int:
+    """Сколько задач уже наступило (текущий бэклог планировщика)."""
+    with _pool.connection() as conn:
+        cur = conn.cursor()
         cur.execute("""
-            SELECT id, user_id, task_name, task_note, status, next_reminder_at, interval, paused_until
-            FROM tasks
-            WHERE user_id = ?
-              AND status = 1
-              AND next_reminder_at <= ?
-              AND (paused_until IS NULL OR paused_until <= ?)
-            ORDER BY next_reminder_at ASC
-            LIMIT ?
-        """, (user_id, now_ts, now_ts, int(limit)))
-    else:
+            SELECT COUNT(*)
+            FROM tasks INDEXED BY idx_tasks_active_due
+            WHERE status = 1
+              AND parked = 0
+              AND effective_due_at <= ?
+        """, (now_ts,))
+        return cur.fetchone()[0]
+
+
+def load_schedule():
+    """
+    Все активные задачи как (id, user_id, due_at) — для in-memory расписания планировщика.
+    Задачи спящих пользователей не грузим: они вернутся через wake_user().
+    """
+    with _pool.connection() as conn:
+        cur = conn.cursor()
         cur.execute("""
-            SELECT id, user_id, task_name, task_note, status, next_reminder_at, interval, paused_until
+            SELECT id, user_id, effective_due_at AS due_at
             FROM tasks
-            WHERE status = 1
-              AND next_reminder_at <= ?
-              AND (paused_until IS NULL OR paused_until <= ?)
-            ORDER BY next_reminder_at ASC
-            LIMIT ?
-        """, (now_ts, now_ts, int(limit)))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+            WHERE status = 1 AND parked = 0
+        """)
+        return cur.fetchall()
 
 
 def mark_done(task_id, user_id) -> bool:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE tasks SET status = 0 WHERE id = ? AND user_id = ?", (task_id, user_id))
-    conn.commit()
-    ok = (cur.rowcount == 1)
-    conn.close()
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE tasks SET status = 0, closed_at = COALESCE(closed_at, ?)
+            WHERE id = ? AND user_id = ?
+        """, (time.time(), task_id, user_id))
+        conn.commit()
+        ok = (cur.rowcount == 1)
+
+    if ok:
+        _notify(task_id, user_id, None)
     return ok
 
 
 def snooze(task_id, user_id, minutes) -> bool:
     if minutes <= 0:
         return False
-    conn = get_connection()
-    cur = conn.cursor()
-
-    # 1) берём текущее paused_until
-    cur.execute("SELECT paused_until FROM tasks WHERE id = ? AND user_id = ?", (task_id, user_id))
-    row = cur.fetchone()
-    now = time.time()
-    base = now
-    if row and row["paused_until"]:
-        # 2) продлеваем от большего из (текущий snooze, сейчас)
-        base = max(now, float(row["paused_until"]))
-
-    new_until = base + int(minutes) * 60
-
-    # 3) пишем в нужную колонку
-    cur.execute(
-        "UPDATE tasks SET paused_until = ? WHERE id = ? AND user_id = ?",
-        (new_until, task_id, user_id),
-    )
-    conn.commit()
-    ok = (cur.rowcount == 1)
-    conn.close()
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+
+        # 1) берём текущее paused_until
+        cur.execute("SELECT next_reminder_at, paused_until FROM tasks WHERE id = ? AND user_id = ?", (task_id, user_id))
+        row = cur.fetchone()
+        now = time.time()
+        base = now
+        if row and row["paused_until"]:
+            # 2) продлеваем от большего из (текущий snooze, сейчас)
+            base = max(now, float(row["paused_until"]))
+
+        new_until = base + int(minutes) * 60
+
+        # 3) пишем в нужную колонку
+        cur.execute(
+            "UPDATE tasks SET paused_until = ? WHERE id = ? AND user_id = ?",
+            (new_until, task_id, user_id),
+        )
+        conn.commit()
+        ok = (cur.rowcount == 1)
+
+    if ok:
+        _notify(task_id, user_id, max(new_until, float(row["next_reminder_at"])))
     return ok
 
 
 def reschedule(task_id, user_id, next_ts) -> bool:
     if next_ts <= time.time():
         return False
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE tasks
-        SET next_reminder_at = ?, paused_until = NULL
-        WHERE id = ? AND user_id = ?
-    """, (next_ts, task_id, user_id))
-    conn.commit()
-    ok = (cur.rowcount == 1)
-    conn.close()
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE tasks
+            SET next_reminder_at = ?, paused_until = NULL
+            WHERE id = ? AND user_id = ?
+        """, (next_ts, task_id, user_id))
+        conn.commit()
+        ok = (cur.rowcount == 1)
+
+    if ok:
+        _notify(task_id, user_id, next_ts)
     return ok
 
 
+def skip_missed(now_ts, chunk_size=50_000) -> int:
+    """
+    Политика catch-up «skip» (при старте планировщика): задачи, пропустившие хотя бы один срок целиком
+    (следующий по сетке тоже уже прошёл), без отправки переносятся на ближайший будущий срок по сетке.
+    Набор UPDATE по chunk_size строк из индекса idx_tasks_active_due, без выборки в Python;
+    коммит на каждую пачку, чтобы не держать блокировку записи долго. Перенесённые строки уходят
+    из диапазона, поэтому каждая следующая пачка начинается с начала индекса.
+    Слушателей не уведомляет: вызывать до load_schedule.
+    Возвращает, сколько задач перенесено.
+    """
+    moved = 0
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        while True:
+            # effective_due_at <= now - 60 — граница для индекса (интервал не меньше минуты),
+            # точное условие «пропущен целый интервал» проверяется следом
+            cur.execute(f"""
+                UPDATE tasks
+                SET next_reminder_at = {_NEXT_SLOT}, paused_until = NULL
+                WHERE id IN (
+                    SELECT id FROM tasks INDEXED BY idx_tasks_active_due
+                    WHERE status = 1
+                      AND parked = 0
+                      AND effective_due_at <= ?
+                      AND interval > 0
+                      AND effective_due_at <= ? - interval * 60
+                      AND (lease_until IS NULL OR lease_until <= ?)
+                    LIMIT ?
+                )
+            """, (now_ts, now_ts - 60, now_ts, now_ts, int(chunk_size)))
+            conn.commit()
+            moved += cur.rowcount
+            if cur.rowcount < chunk_size:
+                break
+    return moved
+
+
+def quiet_hours_settings():
+    """Различные (timezone, quiet_start, quiet_end) пользователей с тихими часами — по индексу idx_users_quiet."""
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT DISTINCT timezone, quiet_start, quiet_end
+            FROM users
+            WHERE quiet_start IS NOT NULL
+        """)
+        return cur.fetchall()
+
+
+_QUIET_CHUNK = 200  # окон на один UPDATE: по 4 параметра, с запасом до лимита SQLite
+# Сколько наступивших задач ещё выгоднее перебрать по индексу idx_tasks_active_due, чем задачи всех
+# пользователей в тихих часах (на 1M задач / 4000 «тихих»: ~0.5 мс на 60 due против ~55 мс; 300k due — 2 с против 0.3 с)
+_QUIET_DUE_PROBE = 5000
+
+_DUE_CANDIDATES = """
+    WHERE t.status = 1 AND t.parked = 0 AND t.effective_due_at <= ? AND (t.lease_until IS NULL OR t.lease_until <= ?)
+"""
+_QUIET_MATCH = """
+    u.timezone IS w.timezone AND u.quiet_start = w.quiet_start AND u.quiet_end = w.quiet_end
+"""
+# Планы прибиты: CROSS JOIN в SQLite фиксирует порядок обхода, INDEXED BY — индекс (без ANALYZE
+# планировщик берёт idx_tasks_status_user_time по одному status и читает все активные задачи),
+# MATERIALIZED не даёт растворить выборку в UPDATE
+_QUIET_BY_DUE = f"""
+    SELECT t.id, w.until
+    FROM tasks t INDEXED BY idx_tasks_active_due CROSS JOIN users u CROSS JOIN w
+    {_DUE_CANDIDATES} AND u.id = t.user_id AND {_QUIET_MATCH}
+"""
+_QUIET_BY_USERS = f"""
+    SELECT t.id, w.until
+    FROM w CROSS JOIN users u CROSS JOIN tasks t INDEXED BY idx_tasks_status_user_time
+    {_DUE_CANDIDATES} AND t.user_id = u.id AND {_QUIET_MATCH}
+"""
+
+
+def defer_quiet(now_ts, windows) -> int:
+    """
+    Наступившие задачи пользователей, у которых сейчас тихие часы, одним UPDATE откладываются
+    до конца окна (paused_until): они уходят из диапазона due, и тики не выбирают их заново.
+    windows — (timezone, quiet_start, quiet_end, until) для окон, активных в now_ts
+    (считает services/quiet_hours.active_windows). Захваченные воркером строки не трогаем.
+    Обычно наступивших задач единицы — тогда идём от них; после простоя, когда бэклог огромный, —
+    от пользователей в тихих часах (см. _QUIET_DUE_PROBE).
+    Возвращает, сколько задач отложено.
+    """
+    windows = list(windows)
+    deferred = []
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        # сначала читаем без блокировки записи: обычно откладывать нечего, а BEGIN IMMEDIATE
+        # на каждом тике с активным окном только мешал бы другим писателям
+        cur.execute("""
+            SELECT count(*) FROM (
+                SELECT 1 FROM tasks INDEXED BY idx_tasks_active_due
+                WHERE status = 1 AND parked = 0 AND effective_due_at <= ? LIMIT ?
+            )
+        """, (now_ts, _QUIET_DUE_PROBE + 1))
+        due = cur.fetchone()[0]
+        if not due:
+            return 0
+        candidates = _QUIET_BY_DUE if due <= _QUIET_DUE_PROBE else _QUIET_BY_USERS
+        chunks = []
+        for i in range(0, len(windows), _QUIET_CHUNK):
+            chunk = windows[i:i + _QUIET_CHUNK]
+            values = ",".join("(?, ?, ?, ?)" for _ in chunk)
+            params = (*(v for window in chunk for v in window), now_ts, now_ts)
+            cur.execute(f"""
+                WITH w(timezone, quiet_start, quiet_end, until) AS (VALUES {values})
+                SELECT EXISTS ({candidates})
+            """, params)
+            if cur.fetchone()[0]:
+                chunks.append((values, params))
+        if not chunks:
+            return 0
+
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            for values, params in chunks:
+                cur.execute(f"""
+                    WITH w(timezone, quiet_start, quiet_end, until) AS (VALUES {values}),
+                    q AS MATERIALIZED ({candidates})
+                    UPDATE tasks
+                    SET paused_until = q.until
+                    FROM q
+                    WHERE tasks.id = q.id
+                    RETURNING tasks.id, tasks.user_id, tasks.paused_until
+                """, params)
+                deferred.extend(cur.fetchall())
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    for task_id, user_id, until in deferred:
+        _notify(task_id, user_id, until)
+    return len(deferred)
+
+
 def set_interval(task_id, user_id, minutes) -> bool:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE tasks
-        SET interval = ?
-        WHERE id = ? AND user_id = ?
-    """, (int(minutes), task_id, user_id))
-    conn.commit()
-    ok = (cur.rowcount == 1)
-    conn.close()
+    if int(minutes) <= 0:
+        raise ValueError("interval must be > 0")
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE tasks
+            SET interval = ?
+            WHERE id = ? AND user_id = ?
+        """, (int(minutes), task_id, user_id))
+        conn.commit()
+        ok = (cur.rowcount == 1)
+
+        cur.execute("""
+            SELECT effective_due_at AS due_at
+            FROM tasks
+            WHERE id = ? AND status = 1
+        """, (task_id,))
+        row = cur.fetchone()
+
+    if ok:
+        _notify(task_id, user_id, row["due_at"] if row else None)
     return ok
 
 
 def delete_task(task_id, user_id) -> bool:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE tasks SET status = 0 WHERE id = ? AND user_id = ?", (task_id, user_id))
-    conn.commit()
-    ok = (cur.rowcount == 1)
-    conn.close()
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE tasks SET status = 0, closed_at = COALESCE(closed_at, ?)
+            WHERE id = ? AND user_id = ?
+        """, (time.time(), task_id, user_id))
+        conn.commit()
+        ok = (cur.rowcount == 1)
+
+    if ok:
+        _notify(task_id, user_id, None)
     return ok
 
 
 def count_open(user_id) -> int:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM tasks WHERE user_id = ? AND status = 1", (user_id,))
-    count = cur.fetchone()[0]
-    conn.close()
-    return count
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM tasks WHERE user_id = ? AND status = 1", (user_id,))
+        return cur.fetchone()[0]
 
 
 def list_open_paged(user_id, offset, limit):
@@ -212,39 +547,458 @@ def list_open_paged(user_id, offset, limit):
     if offset < 0:
         offset = 0
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, task_name, next_reminder_at, interval, task_note, paused_until
-        FROM tasks
-        WHERE user_id = ? AND status = 1
-        ORDER BY next_reminder_at ASC
-        LIMIT ? OFFSET ?
-    """, (user_id, int(limit), int(offset)))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, task_name, next_reminder_at, interval, task_note, paused_until
+            FROM tasks
+            WHERE user_id = ? AND status = 1
+            ORDER BY next_reminder_at ASC
+            LIMIT ? OFFSET ?
+        """, (user_id, int(limit), int(offset)))
+        return cur.fetchall()
+
+def list_open_page(user_id, cursor, limit, backward=False):
+    """
+    Keyset-пагинация по (next_reminder_at, id): одна страница + общее число открытых задач
+    одним запросом. Стоимость не зависит от номера страницы (в отличие от OFFSET).
+    cursor — (next_reminder_at, id) или None (начало списка);
+    backward=False: строки строго после cursor, backward=True: строго до него.
+    Строки всегда возвращаются по возрастанию. Возвращает (rows, total).
+    """
+    if limit <= 0:
+        return [], 0
+    if cursor is None:
+        cursor = (float("-inf"), 0)
+    ts, task_id = cursor
+
+    if backward:
+        keyset, order = "(next_reminder_at, id) < (?, ?)", "DESC"
+    else:
+        keyset, order = "(next_reminder_at, id) > (?, ?)", "ASC"
+
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        # LEFT JOIN, чтобы total пришёл даже для пустой страницы
+        cur.execute(f"""
+            SELECT c.total, p.*
+            FROM (SELECT COUNT(*) AS total FROM tasks WHERE user_id = ? AND status = 1) AS c
+            LEFT JOIN (
+                SELECT id, task_name, next_reminder_at, interval, task_note, paused_until
+                FROM tasks
+                WHERE user_id = ? AND status = 1 AND {keyset}
+                ORDER BY next_reminder_at {order}, id {order}
+                LIMIT ?
+            ) AS p ON 1
+            ORDER BY p.next_reminder_at ASC, p.id ASC
+        """, (user_id, user_id, float(ts), int(task_id), int(limit)))
+        result = cur.fetchall()
+
+    total = result[0]["total"]
+    rows = [row for row in result if row["id"] is not None]
+    return rows, total
 
 def set_sleep_state(user_id: int, sleeping: bool):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET is_sleeping = ? WHERE id = ?", (1 if sleeping else 0, user_id))
-    conn.commit()
-    conn.close()
+    """
+    Сон пользователя. Его активные задачи паркуются (tasks.parked) в той же транзакции: выборки due
+    их больше не видят. Разбудить с переносом пропущенных сроков — wake_user.
+    """
+    flag = 1 if sleeping else 0
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE users SET is_sleeping = ? WHERE id = ?", (flag, user_id))
+        cur.execute("""
+            UPDATE tasks SET parked = ?
+            WHERE user_id = ? AND status = 1 AND parked != ?
+            RETURNING id, effective_due_at
+        """, (flag, user_id, flag))
+        changed = cur.fetchall()
+        conn.commit()
+
+    _notify_user(user_id)
+    # запаркованные уходят из расписания планировщика, распаркованные возвращаются
+    for task_id, due_at in changed:
+        _notify(task_id, user_id, None if sleeping else due_at)
+
+def wake_user(user_id: int, now_ts=None):
+    """
+    Снимает сон и возвращает задачи, наступившие за время сна.
+    Их next_reminder_at одним UPDATE переносится на ближайший будущий срок по сетке задачи —
+    вместо шквала напоминаний пользователь получает одно сводное сообщение.
+    """
+    now = time.time() if now_ts is None else now_ts
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE users SET is_sleeping = 0 WHERE id = ?", (user_id,))
+
+        cur.execute("""
+            SELECT id, task_name, task_note, next_reminder_at, interval
+            FROM tasks
+            WHERE user_id = ?
+              AND status = 1
+              AND next_reminder_at <= ?
+              AND (paused_until IS NULL OR paused_until <= ?)
+            ORDER BY next_reminder_at ASC
+        """, (user_id, now, now))
+        missed = cur.fetchall()
+
+        cur.execute(f"""
+            UPDATE tasks
+            SET next_reminder_at = {_NEXT_SLOT}, paused_until = NULL
+            WHERE user_id = ?
+              AND status = 1
+              AND interval > 0
+              AND next_reminder_at <= ?
+              AND (paused_until IS NULL OR paused_until <= ?)
+        """, (now, user_id, now, now))
+        # уже перенесённые на будущий срок — обратно в выборки due
+        cur.execute("UPDATE tasks SET parked = 0 WHERE user_id = ? AND parked = 1", (user_id,))
+        conn.commit()
+
+        # расписание планировщика не держало задачи спящего — возвращаем их все
+        cur.execute("""
+            SELECT id, effective_due_at AS due_at
+            FROM tasks
+            WHERE user_id = ? AND status = 1
+        """, (user_id,))
+        schedule = cur.fetchall()
+
+    _notify_user(user_id)
+    for row in schedule:
+        _notify(row["id"], user_id, row["due_at"])
+    return missed
 
 def is_user_sleeping(user_id: int) -> bool:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT is_sleeping FROM users WHERE id = ?", (user_id,))
-    row = cur.fetchone()
-    conn.close()
-    return bool(row["is_sleeping"]) if row else False
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT is_sleeping FROM users WHERE id = ?", (user_id,))
+        row = cur.fetchone()
+        return bool(row["is_sleeping"]) if row else False
 
 
 def get_user_by_id(user_id: int):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row
\ No newline at end of file
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+        return cur.fetchone()
+
+
+# ---- захват задач воркерами планировщика ----
+# Несколько процессов на одной базе: перед отправкой строка захватывается (lease_owner, lease_until).
+# Чужой живой захват пропускаем; истёкший (воркер упал) забирает первый, кто придёт.
+_LEASE_CHUNK = 500
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), _LEASE_CHUNK):
+        yield ids[i:i + _LEASE_CHUNK]
+
+
+def _release(cur, owner, task_ids):
+    for chunk in _chunks(task_ids):
+        marks = ",".join("?" * len(chunk))
+        cur.execute(f"""
+            UPDATE tasks SET lease_owner = NULL, lease_until = NULL
+            WHERE lease_owner = ? AND id IN ({marks})
+        """, (owner, *chunk))
+
+
+def claim_due(owner, now_ts, limit, lease_seconds):
+    """
+    Атомарно захватывает до limit наступивших задач на lease_seconds и возвращает их вместе
+    с полями пользователя для отправки: chat_id (telegram_user_id), is_sleeping и timezone.
+    BEGIN IMMEDIATE берёт блокировку записи сразу, поэтому два воркера не захватят одну строку.
+    """
+    if limit <= 0:
+        return []
+
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute("""
+                UPDATE tasks
+                SET lease_owner = ?, lease_until = ?
+                WHERE id IN (
+                    SELECT t.id
+                    FROM tasks t INDEXED BY idx_tasks_active_due
+                    WHERE t.status = 1
+                      AND t.parked = 0
+                      AND t.effective_due_at <= ?
+                      AND (t.lease_until IS NULL OR t.lease_until <= ?)
+                    ORDER BY t.effective_due_at ASC
+                    LIMIT ?
+                )
+                RETURNING id
+            """, (owner, now_ts + lease_seconds, now_ts, now_ts, int(limit)))
+            ids = [r[0] for r in cur.fetchall()]
+            rows = []
+            for chunk in _chunks(ids):
+                marks = ",".join("?" * len(chunk))
+                cur.execute(f"""
+                    SELECT t.id, t.user_id, t.task_name, t.task_note, t.status, t.next_reminder_at,
+                           t.interval, t.paused_until,
+                           u.telegram_user_id AS chat_id, u.is_sleeping, u.timezone
+                    FROM tasks t
+                    JOIN users u ON u.id = t.user_id
+                    WHERE t.id IN ({marks})
+                """, chunk)
+                rows.extend(cur.fetchall())
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    rows.sort(key=lambda r: max(r["next_reminder_at"], r["paused_until"] or 0))
+    return rows
+
+
+def release_leases(owner, task_ids) -> None:
+    """Снимает захват без переноса (отправка не удалась) — строку сразу может взять любой воркер."""
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        _release(cur, owner, task_ids)
+        conn.commit()
+
+
+# ---- outbox: очередь отправки напоминаний ----
+# pending -> sending (захвачена воркером до next_attempt_at) -> sent | failed;
+# неудачная попытка возвращает строку в pending с next_attempt_at в будущем (backoff).
+_OUTBOX_COLUMNS = "id, task_id, user_id, chat_id, text, due_at, attempts"
+
+
+def enqueue_outbox(owner, items, lease_seconds):
+    """
+    Кладёт напоминания в outbox и переносит их задачи на следующий срок — одной транзакцией.
+    items: (task_id, user_id, chat_id, text, due_at, next_ts); задачи должны быть захвачены owner (claim_due).
+    Задачу, захват которой истёк, не трогаем: её мог забрать другой воркер, и сообщение было бы дублем.
+    Закрытую или удалённую, пока она была захвачена, — тоже: напоминать уже не о чем.
+    Строки outbox сразу создаются захваченными на owner (state='sending'), чтобы отправить их
+    без повторной выборки. Если по задаче уже висит неотправленное сообщение, новое не добавляется.
+    Возвращает созданные строки outbox.
+    """
+    if not items:
+        return []
+    now = time.time()
+    created = []
+    moved = []
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            for task_id, user_id, chat_id, text, due_at, next_ts in items:
+                cur.execute(f"""
+                    INSERT OR IGNORE INTO outbox
+                        (task_id, user_id, chat_id, text, due_at, state, next_attempt_at, lease_owner, created_at)
+                    SELECT ?, ?, ?, ?, ?, 'sending', ?, ?, ?
+                    WHERE EXISTS (
+                        SELECT 1 FROM tasks WHERE id = ? AND status = 1 AND lease_owner = ? AND lease_until > ?
+                    )
+                    RETURNING {_OUTBOX_COLUMNS}
+                """, (task_id, user_id, chat_id, text, due_at, now + lease_seconds, owner, now,
+                      task_id, owner, now))
+                created.extend(cur.fetchall())
+                cur.execute("""
+                    UPDATE tasks
+                    SET next_reminder_at = ?, paused_until = NULL, lease_owner = NULL, lease_until = NULL
+                    WHERE id = ? AND status = 1 AND lease_owner = ? AND lease_until > ?
+                """, (next_ts, task_id, owner, now))
+                if cur.rowcount:
+                    moved.append((task_id, user_id, next_ts))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    for task_id, user_id, next_ts in moved:
+        _notify(task_id, user_id, next_ts)
+    return created
+
+
+def claim_outbox(owner, now_ts, limit, lease_seconds):
+    """
+    Захватывает сообщения, которым пора на повтор, и брошенные упавшими воркерами (захват истёк).
+    Сообщения задач, которые с тех пор закрыли или удалили, сразу переводятся в failed.
+    Спящим пользователям повторы не шлём, пока не проснутся.
+    """
+    if limit <= 0:
+        return []
+
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute("""
+                UPDATE outbox
+                SET state = 'failed', lease_owner = NULL, last_error = 'task is no longer active'
+                WHERE state IN ('pending', 'sending')
+                  AND next_attempt_at <= ?
+                  AND NOT EXISTS (SELECT 1 FROM tasks t WHERE t.id = outbox.task_id AND t.status = 1)
+            """, (now_ts,))
+            cur.execute(f"""
+                UPDATE outbox
+                SET state = 'sending', lease_owner = ?, next_attempt_at = ?
+                WHERE id IN (
+                    SELECT o.id
+                    FROM outbox o
+                    JOIN users u ON u.id = o.user_id
+                    WHERE o.state IN ('pending', 'sending')
+                      AND o.next_attempt_at <= ?
+                      AND u.is_sleeping = 0
+                    ORDER BY o.next_attempt_at ASC
+                    LIMIT ?
+                )
+                RETURNING {_OUTBOX_COLUMNS}
+            """, (owner, now_ts + lease_seconds, now_ts, int(limit)))
+            rows = cur.fetchall()
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return rows
+
+
+def renew_outbox(owner, outbox_ids, lease_until) -> int:
+    """Продлевает захват сообщений, которые воркер ещё отправляет. Возвращает, сколько продлено."""
+    renewed = 0
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        for chunk in _chunks(outbox_ids):
+            marks = ",".join("?" * len(chunk))
+            cur.execute(f"""
+                UPDATE outbox SET next_attempt_at = ?
+                WHERE state = 'sending' AND lease_owner = ? AND id IN ({marks})
+            """, (lease_until, owner, *chunk))
+            renewed += cur.rowcount
+        conn.commit()
+    return renewed
+
+
+def settle_outbox(owner, sent=(), retry=(), failed=()) -> None:
+    """
+    Итог попыток отправки, одной транзакцией:
+    sent   — (outbox_id, task_id, sent_at): state='sent', у задачи обновляется last_sent_at;
+    retry  — (outbox_id, attempts_delta, next_attempt_at, error): обратно в pending до next_attempt_at;
+    failed — (outbox_id, error): окончательно failed.
+    Строки, которые тем временем перехватил другой воркер, не трогаем.
+    """
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        if sent:
+            cur.executemany("""
+                UPDATE outbox SET state = 'sent', sent_at = ?, attempts = attempts + 1, lease_owner = NULL
+                WHERE id = ? AND lease_owner = ?
+            """, [(sent_at, outbox_id, owner) for outbox_id, _, sent_at in sent])
+            cur.executemany(
+                "UPDATE tasks SET last_sent_at = ? WHERE id = ?",
+                [(sent_at, task_id) for _, task_id, sent_at in sent],
+            )
+        if retry:
+            cur.executemany("""
+                UPDATE outbox
+                SET state = 'pending', attempts = attempts + ?, next_attempt_at = ?,
+                    last_error = COALESCE(?, last_error), lease_owner = NULL
+                WHERE id = ? AND lease_owner = ?
+            """, [(delta, next_at, error, outbox_id, owner) for outbox_id, delta, next_at, error in retry])
+        if failed:
+            cur.executemany("""
+                UPDATE outbox SET state = 'failed', attempts = attempts + 1, last_error = ?, lease_owner = NULL
+                WHERE id = ? AND lease_owner = ?
+            """, [(error, outbox_id, owner) for outbox_id, error in failed])
+        conn.commit()
+
+
+def purge_outbox(before_ts) -> int:
+    """Удаляет отправленные и окончательно упавшие сообщения старше before_ts."""
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            DELETE FROM outbox
+            WHERE state IN ('sent', 'failed') AND created_at < ?
+        """, (before_ts,))
+        conn.commit()
+        return cur.rowcount
+
+
+# ---- архив закрытых задач ----
+_ARCHIVE_COLUMNS = (
+    "id, user_id, task_name, task_note, status, next_reminder_at, interval, paused_until, last_sent_at, closed_at"
+)
+
+
+def archive_closed(before_ts, batch_size=500) -> int:
+    """
+    Переносит до batch_size закрытых задач (closed_at <= before_ts или не записан — закрыты
+    до появления колонки) в tasks_archive одной короткой транзакцией. Сообщения outbox этих задач
+    удаляются каскадом. Возвращает, сколько перенесено; меньше batch_size — больше нечего.
+    """
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("""
+            SELECT id FROM tasks
+            WHERE status = 0 AND (closed_at IS NULL OR closed_at <= ?)
+            LIMIT ?
+        """, (before_ts, int(batch_size)))
+        ids = [r[0] for r in cur.fetchall()]
+        if ids:
+            marks = ",".join("?" * len(ids))
+            cur.execute(f"""
+                INSERT OR REPLACE INTO tasks_archive ({_ARCHIVE_COLUMNS}, archived_at)
+                SELECT {_ARCHIVE_COLUMNS}, ? FROM tasks WHERE id IN ({marks})
+            """, (time.time(), *ids))
+            cur.execute(f"DELETE FROM tasks WHERE id IN ({marks})", ids)
+        conn.commit()
+    return len(ids)
+
+
+def incremental_vacuum(max_pages=0) -> int:
+    """
+    Возвращает файлу свободные страницы (до max_pages, 0 — все); сколько байт освобождено.
+    Работает только при auto_vacuum = INCREMENTAL, иначе ничего не делает и возвращает 0.
+    """
+    with _pool.connection() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # fetchall обязателен: прагма освобождает страницы по мере чтения результата
+        conn.execute(f"PRAGMA incremental_vacuum({int(max_pages)})").fetchall()
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return (before - after) * page_size
+
+
+# ---- состояния FSM (app/db/fsm_storage.py) ----
+def fsm_get(key, not_before):
+    """(state, data_json, updated_at) диалога или None; записи старше not_before считаются истёкшими."""
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT state, data, updated_at FROM fsm_state WHERE key = ? AND updated_at >= ?", (key, not_before))
+        return cur.fetchone()
+
+
+def fsm_write_many(upserts, deletes) -> None:
+    """
+    Пачка отложенных записей одной транзакцией.
+    upserts: (key, state, data_json, updated_at); deletes: ключи закончившихся диалогов.
+    """
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        if upserts:
+            cur.executemany("""
+                INSERT INTO fsm_state (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+            """, upserts)
+        if deletes:
+            cur.executemany("DELETE FROM fsm_state WHERE key = ?", [(k,) for k in deletes])
+        conn.commit()
+
+
+def fsm_expire(before_ts) -> int:
+    """Удаляет диалоги, которые не трогали с before_ts. Возвращает, сколько удалено."""
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM fsm_state WHERE updated_at < ?", (before_ts,))
+        conn.commit()
+        return cur.rowcount
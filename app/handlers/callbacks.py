@@ -0,0 +1,46 @@
+# app/handlers/callbacks.py
+"""
+Единая точка входа для нажатий инлайн-кнопок.
+
+callback_data разбирается один раз (services/callback_data.decode) в ListAction,
+обработчик ищется в словаре по коду действия — вместо цепочки фильтров F.data.startswith(...),
+которую aiogram проверял бы по очереди на каждое нажатие.
+Обработчики регистрируются декоратором @on(код), см. app/handlers/list.py.
+"""
+import logging
+import sqlite3
+from typing import Awaitable, Callable
+
+from aiogram import Router
+from aiogram.types import CallbackQuery
+
+from app.services.callback_data import ListAction, decode
+
+log = logging.getLogger(__name__)
+
+router = Router()
+
+# третий аргумент — строка users (sqlite3.Row), её подставляет UserMiddleware
+Handler = Callable[[CallbackQuery, ListAction, sqlite3.Row], Awaitable[None]]
+_handlers: dict[str, Handler] = {}
+
+
+def on(action: str):
+    def register(fn: Handler) -> Handler:
+        if action in _handlers:
+            raise ValueError(f"callback action {action!r} already registered")
+        _handlers[action] = fn
+        return fn
+    return register
+
+
+@router.callback_query()
+async def dispatch(query: CallbackQuery, user):
+    act = decode(query.data)
+    handler = _handlers.get(act.action) if act is not None else None
+    if handler is None:
+        # испорченная или чужая callback_data — не падаем внутри хендлера, просто гасим «часики»
+        log.debug("unknown callback data: %r", query.data)
+        await query.answer("Кнопка устарела — открой /list заново")
+        return
+    await handler(query, act, user)
@@ -0,0 +1,98 @@
+# app/handlers/import_tasks.py
+import io
+
+from aiogram import Router, html
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message
+
+from app.db import async_repo
+from app.services.task_import import MAX_LINES, ImportResult, parse_lines
+
+router = Router()
+
+# Сколько ошибочных строк перечислять в сводке (сообщение Telegram — не больше 4096 символов)
+ERRORS_LIMIT = 20
+MAX_FILE_BYTES = 256 * 1024
+
+HELP_TEXT = (
+    "Пришли список задач сообщением или .txt-файлом — по одной на строку:\n"
+    "<code>название | заметка | интервал</code>\n\n"
+    "Например:\n"
+    "<code>Полить цветы | на балконе | 2 часа\n"
+    "Размяться | - | 45 минут\n"
+    "Проверить почту | полчаса</code>\n\n"
+    f"Заметку можно пропустить. За раз — не больше {MAX_LINES} строк."
+)
+
+
+class ImportForm(StatesGroup):
+    waiting = State()
+
+
+def format_summary(result: ImportResult, added: int) -> str:
+    lines = [f"📥 Импортировано задач: {added}" if added else "📥 Ни одной задачи не добавлено"]
+    if result.errors:
+        lines.append("")
+        lines.append(f"Не удалось разобрать строк: {len(result.errors)}")
+        for err in result.errors[:ERRORS_LIMIT]:
+            lines.append(f"• строка {err.line_no}: {html.quote(err.reason)}")
+        if len(result.errors) > ERRORS_LIMIT:
+            lines.append(f"…и ещё {len(result.errors) - ERRORS_LIMIT}")
+    if result.skipped:
+        lines.append("")
+        lines.append(f"Строк сверх лимита ({MAX_LINES}) пропущено: {result.skipped}")
+    return "\n".join(lines)
+
+
+async def _read_document(message: Message) -> str | None:
+    doc = message.document
+    if doc.file_size and doc.file_size > MAX_FILE_BYTES:
+        await message.answer(f"Файл слишком большой — нужен текстовый файл до {MAX_FILE_BYTES // 1024} КБ.")
+        return None
+    buf = await message.bot.download(doc, destination=io.BytesIO())
+    try:
+        return buf.getvalue().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        await message.answer("Не получилось прочитать файл — сохрани его как текст в UTF-8.")
+        return None
+
+
+async def _import(message: Message, user, text: str) -> None:
+    result = parse_lines(text)
+    if not result.items and not result.errors:
+        await message.answer(HELP_TEXT)
+        return
+    # все строки — одной транзакцией
+    ids = await async_repo.add_tasks(int(user["id"]), result.items)
+    await message.answer(format_summary(result, len(ids)))
+
+
+@router.message(Command("import"))
+async def import_cmd(message: Message, command: CommandObject, state: FSMContext, user):
+    # список прямо в сообщении после /import или файл с подписью /import
+    if message.document is not None:
+        text = await _read_document(message)
+        if text is not None:
+            await _import(message, user, text)
+        return
+    if command.args:
+        await _import(message, user, command.args)
+        return
+    await state.set_state(ImportForm.waiting)
+    await message.answer(HELP_TEXT)
+
+
+@router.message(ImportForm.waiting)
+async def import_payload(message: Message, state: FSMContext, user):
+    if message.document is not None:
+        text = await _read_document(message)
+    elif message.text:
+        text = message.text
+    else:
+        await message.answer(HELP_TEXT)
+        return
+    await state.clear()
+    if text is not None:
+        await _import(message, user, text)
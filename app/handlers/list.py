@@ -1,162 +1,114 @@
 # app/handlers/list.py
-from aiogram import Router, F
+from aiogram import Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.utils.chat_action import ChatActionSender
 
-from app.db.repo import get_or_create_user, count_open
 from app.service import build_list_view
-from app.db import repo
+from app.db import async_repo
+from app.handlers.callbacks import on
+from app.services import callback_data as cbd
+from app.services.callback_data import ListAction
+from app.services.render_cache import message_hashes
 
 router = Router()
 
 
 @router.message(Command("list"))
-async def list_cmd(message: Message):
+async def list_cmd(message: Message, user):
     # первая страница
-    user = get_or_create_user(telegram_user_id=message.from_user.id,
-                              username=message.from_user.username)
     user_id = int(user["id"])
-    text, kb = build_list_view(user_id, page=0, limit=5, selected_task_id=None)
-    async with ChatActionSender.typing(message.bot, message.chat.id):
-        await message.answer(text, reply_markup=kb)
+    text, kb = await build_list_view(user_id, page=0, limit=5, selected_task_id=None, tz=user["timezone"])
+    async with ChatActionSender.typing(message.chat.id, message.bot):
+        sent = await message.answer(text, reply_markup=kb)
+    message_hashes.remember(sent.chat.id, sent.message_id, message_hashes.digest(text, kb))
+
+
+async def _edit(query: CallbackQuery, text: str, kb: InlineKeyboardMarkup):
+    # Telegram отвечает ошибкой «message is not modified» на edit без изменений —
+    # такие вызовы просто не делаем
+    msg = query.message
+    digest = message_hashes.digest(text, kb)
+    if message_hashes.is_same(msg.chat.id, msg.message_id, digest):
+        return
+    try:
+        await msg.edit_text(text, reply_markup=kb)
+    except TelegramBadRequest as e:
+        # хэша могло не быть (рестарт) — содержимое совпало с тем, что уже в чате
+        if "message is not modified" not in str(e):
+            raise
+    message_hashes.remember(msg.chat.id, msg.message_id, digest)
 
 
 # ===== колбэки =====
+# callback_data уже разобрана в ListAction (app/handlers/callbacks.py)
 
-def _parse_parts(cb: str):
-    # универсальный парсер callback_data, разделённых '|'
-    # возвращает список частей
-    return cb.split("|")
-
-
-@router.callback_query(F.data.startswith("list_page|"))
-async def cb_list_page(query: CallbackQuery):
-    # list_page|{page}|{limit}
-    parts = _parse_parts(query.data)
-    page = int(parts[1])
-    limit = int(parts[2])
-
-    user = get_or_create_user(telegram_user_id=query.from_user.id,
-                              username=query.from_user.username)
-    user_id = int(user["id"])
-
-    text, kb = build_list_view(user_id, page=page, limit=limit, selected_task_id=None)
-    await query.message.edit_text(text, reply_markup=kb)
+@on(cbd.PAGE)
+async def cb_list_page(query: CallbackQuery, act: ListAction, user):
+    text, kb = await build_list_view(int(user["id"]), page=act.page, limit=act.limit, selected_task_id=None,
+                                     cursor=act.cursor, backward=act.backward, tz=user["timezone"])
+    await _edit(query, text, kb)
     await query.answer()
 
 
-@router.callback_query(F.data.startswith("select_task|"))
-async def cb_select_task(query: CallbackQuery):
-    # select_task|{task_id}|{page}|{limit}
-    parts = _parse_parts(query.data)
-    task_id = int(parts[1])
-    page = int(parts[2])
-    limit = int(parts[3])
-
-    user = get_or_create_user(telegram_user_id=query.from_user.id,
-                              username=query.from_user.username)
-    user_id = int(user["id"])
-
-    text, kb = build_list_view(user_id, page=page, limit=limit, selected_task_id=task_id)
-    await query.message.edit_text(text, reply_markup=kb)
+@on(cbd.SELECT)
+async def cb_select_task(query: CallbackQuery, act: ListAction, user):
+    text, kb = await build_list_view(int(user["id"]), page=act.page, limit=act.limit,
+                                     selected_task_id=act.task_id, cursor=act.cursor, tz=user["timezone"])
+    await _edit(query, text, kb)
     await query.answer()
 
 
-@router.callback_query(F.data.startswith("task_done|"))
-async def cb_task_done(query: CallbackQuery):
-    # task_done|{task_id}|{page}|{limit}
-    parts = _parse_parts(query.data)
-    task_id = int(parts[1])
-    page = int(parts[2])
-    limit = int(parts[3])
-
-    user = get_or_create_user(telegram_user_id=query.from_user.id,
-                              username=query.from_user.username)
+@on(cbd.DONE)
+async def cb_task_done(query: CallbackQuery, act: ListAction, user):
     user_id = int(user["id"])
 
-    ok = repo.mark_done(task_id, user_id)
+    ok = await async_repo.mark_done(act.task_id, user_id)
     if not ok:
         await query.answer("Не получилось отметить выполненной (возможно, не ваша задача?)", show_alert=True)
-    # пересчитать страницу: она могла опустеть
-    total = count_open(user_id)
-    pages = (total + limit - 1) // limit
-    if pages == 0:
-        # пусто, показываем пустой список
-        text, kb = build_list_view(user_id, page=0, limit=limit, selected_task_id=None)
-    else:
-        if page >= pages:
-            page = max(0, pages - 1)
-        text, kb = build_list_view(user_id, page=page, limit=limit, selected_task_id=None)
-
-    await query.message.edit_text(text, reply_markup=kb)
-    await query.answer("Готово ✅")
+    # страница могла опустеть — build_list_view сам откатится на предыдущую
+    text, kb = await build_list_view(user_id, page=act.page, limit=act.limit, selected_task_id=None,
+                                     cursor=act.cursor, tz=user["timezone"])
 
+    await _edit(query, text, kb)
+    await query.answer("Готово ✅")
 
-@router.callback_query(F.data.startswith("task_snooze|"))
-async def cb_task_snooze(query: CallbackQuery):
-    # task_snooze|{task_id}|{minutes}|{page}|{limit}
-    parts = _parse_parts(query.data)
-    task_id = int(parts[1])
-    minutes = int(parts[2])
-    page = int(parts[3])
-    limit = int(parts[4])
 
-    user = get_or_create_user(telegram_user_id=query.from_user.id,
-                              username=query.from_user.username)
+@on(cbd.SNOOZE)
+async def cb_task_snooze(query: CallbackQuery, act: ListAction, user):
     user_id = int(user["id"])
 
-    ok = repo.snooze(task_id, user_id, minutes)
+    ok = await async_repo.snooze(act.task_id, user_id, act.minutes)
     if not ok:
         await query.answer("Не удалось отложить", show_alert=True)
 
     # после snooze задача может «уехать», возвращаемся к списку
-    text, kb = build_list_view(user_id, page=page, limit=limit, selected_task_id=task_id)
-    await query.message.edit_text(text, reply_markup=kb)
+    text, kb = await build_list_view(user_id, page=act.page, limit=act.limit, selected_task_id=act.task_id,
+                                     cursor=act.cursor, tz=user["timezone"])
+    await _edit(query, text, kb)
     await query.answer("Отложено ⏱")
 
 
-@router.callback_query(F.data.startswith("task_delete|"))
-async def cb_task_delete(query: CallbackQuery):
-    # task_delete|{task_id}|{page}|{limit}
-    parts = _parse_parts(query.data)
-    task_id = int(parts[1])
-    page = int(parts[2])
-    limit = int(parts[3])
-
-    user = get_or_create_user(telegram_user_id=query.from_user.id,
-                              username=query.from_user.username)
+@on(cbd.DELETE)
+async def cb_task_delete(query: CallbackQuery, act: ListAction, user):
     user_id = int(user["id"])
 
-    ok = repo.delete_task(task_id, user_id)
+    ok = await async_repo.delete_task(act.task_id, user_id)
     if not ok:
         await query.answer("Не удалось удалить", show_alert=True)
 
-    # пересчитать страницу
-    total = count_open(user_id)
-    pages = (total + limit - 1) // limit
-    if pages == 0:
-        text, kb = build_list_view(user_id, page=0, limit=limit, selected_task_id=None)
-    else:
-        if page >= pages:
-            page = max(0, pages - 1)
-        text, kb = build_list_view(user_id, page=page, limit=limit, selected_task_id=None)
-
-    await query.message.edit_text(text, reply_markup=kb)
-    await query.answer("Удалено 🗑")
-
+    # страница могла опустеть — build_list_view сам откатится на предыдущую
+    text, kb = await build_list_view(user_id, page=act.page, limit=act.limit, selected_task_id=None,
+                                     cursor=act.cursor, tz=user["timezone"])
 
-@router.callback_query(F.data.startswith("back_to_list|"))
-async def cb_back_to_list(query: CallbackQuery):
-    # back_to_list|{page}|{limit}
-    parts = _parse_parts(query.data)
-    page = int(parts[1])
-    limit = int(parts[2])
+    await _edit(query, text, kb)
+    await query.answer("Удалено 🗑")
 
-    user = get_or_create_user(telegram_user_id=query.from_user.id,
-                              username=query.from_user.username)
-    user_id = int(user["id"])
 
-    text, kb = build_list_view(user_id, page=page, limit=limit, selected_task_id=None)
-    await query.message.edit_text(text, reply_markup=kb)
+@on(cbd.BACK)
+async def cb_back_to_list(query: CallbackQuery, act: ListAction, user):
+    text, kb = await build_list_view(int(user["id"]), page=act.page, limit=act.limit, selected_task_id=None,
+                                     cursor=act.cursor, tz=user["timezone"])
+    await _edit(query, text, kb)
     await query.answer()
@@ -0,0 +1,55 @@
+# app/handlers/settings.py
+from aiogram import Router, html
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from app.db import async_repo
+from app.services.quiet_hours import DEFAULT_TZ, format_window, is_valid_tz, parse_window
+
+router = Router()
+
+
+@router.message(Command("tz"))
+async def set_timezone(message: Message, command: CommandObject, user):
+    name = (command.args or "").strip()
+    if not name:
+        await message.answer(
+            f"Твой часовой пояс: <code>{html.quote(user['timezone'] or DEFAULT_TZ)}</code>\n"
+            "Сменить: <code>/tz Europe/Moscow</code>"
+        )
+        return
+    if not is_valid_tz(name):
+        await message.answer("Не знаю такого часового пояса. Пример: <code>/tz Europe/Moscow</code>")
+        return
+    await async_repo.update_timezone(user["id"], name)
+    await message.answer(f"🌍 Часовой пояс: <code>{html.quote(name)}</code>")
+
+
+@router.message(Command("quiet"))
+async def set_quiet(message: Message, command: CommandObject, user):
+    # /quiet 23:00-08:00 — окно в часовом поясе пользователя; /quiet off — выключить
+    arg = (command.args or "").strip()
+    if not arg:
+        if user["quiet_start"] is None:
+            current = "выключены"
+        else:
+            current = format_window(user["quiet_start"], user["quiet_end"])
+        await message.answer(
+            f"Тихие часы: {current}\n"
+            "Задать: <code>/quiet 23:00-08:00</code>, выключить: <code>/quiet off</code>"
+        )
+        return
+    if arg.lower() in ("off", "выкл", "нет"):
+        await async_repo.set_quiet_hours(user["id"], None, None)
+        await message.answer("🔔 Тихие часы выключены.")
+        return
+
+    window = parse_window(arg)
+    if window is None:
+        await message.answer("Не понял окно. Пример: <code>/quiet 23:00-08:00</code>")
+        return
+    await async_repo.set_quiet_hours(user["id"], *window)
+    await message.answer(
+        f"🌙 Тихие часы: {format_window(*window)} ({html.quote(user['timezone'] or DEFAULT_TZ)}). "
+        "Напоминания, выпавшие на них, придут, когда окно закончится."
+    )
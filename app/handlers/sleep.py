@@ -1,18 +1,35 @@
-from aiogram import Router
+from aiogram import Router, html
 from aiogram.filters import Command
 from aiogram.types import Message
-from app.db.repo import get_or_create_user, set_sleep_state
+from app.db.async_repo import set_sleep_state, wake_user
 
 router = Router()
 
+# Сколько пропущенных задач перечислять в сводке после /awake
+CATCH_UP_LIMIT = 20
+
+
+def format_catch_up(missed) -> str:
+    lines = ["🌞 Доброе утро! Я снова буду напоминать тебе о задачах."]
+    if not missed:
+        return lines[0]
+
+    lines.append("")
+    lines.append(f"Пока ты спал(а), наступило напоминаний: {len(missed)}")
+    for row in missed[:CATCH_UP_LIMIT]:
+        lines.append(f"• <b>{html.quote(row['task_name'])}</b>")
+    if len(missed) > CATCH_UP_LIMIT:
+        lines.append(f"…и ещё {len(missed) - CATCH_UP_LIMIT}")
+    return "\n".join(lines)
+
+
 @router.message(Command("sleep"))
-async def go_sleep(message: Message):
-    user = get_or_create_user(message.from_user.id, message.from_user.username)
-    set_sleep_state(user["id"], True)
+async def go_sleep(message: Message, user):
+    await set_sleep_state(user["id"], True)
     await message.answer("😴 Хорошо, я не буду тебя беспокоить, пока ты спишь.")
 
 @router.message(Command("awake"))
-async def wake_up(message: Message):
-    user = get_or_create_user(message.from_user.id, message.from_user.username)
-    set_sleep_state(user["id"], False)
-    await message.answer("🌞 Доброе утро! Я снова буду напоминать тебе о задачах.")
+async def wake_up(message: Message, user):
+    # одно сводное сообщение вместо пачки напоминаний за всю ночь
+    missed = await wake_user(user["id"])
+    await message.answer(format_catch_up(missed))
@@ -0,0 +1,103 @@
+# app/middlewares/user.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.db import async_repo, repo
+
+
+class UserCache:
+    """
+    Ограниченный LRU-кэш с TTL: telegram_user_id -> строка users.
+    Сброс по внутреннему user_id приходит из потоков БД (repo.add_user_listener),
+    поэтому все операции под блокировкой.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: OrderedDict[int, tuple[Any, float]] = OrderedDict()
+        self._by_user_id: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, telegram_user_id: int):
+        with self._lock:
+            item = self._items.get(telegram_user_id)
+            if item is None:
+                return None
+            row, expires_at = item
+            if expires_at <= time.monotonic():
+                self._drop(telegram_user_id)
+                return None
+            self._items.move_to_end(telegram_user_id)
+            return row
+
+    def put(self, telegram_user_id: int, row) -> None:
+        with self._lock:
+            self._items[telegram_user_id] = (row, time.monotonic() + self.ttl)
+            self._items.move_to_end(telegram_user_id)
+            self._by_user_id[int(row["id"])] = telegram_user_id
+            while len(self._items) > self.maxsize:
+                oldest = next(iter(self._items))
+                self._drop(oldest)
+
+    def invalidate(self, telegram_user_id: int) -> None:
+        with self._lock:
+            self._drop(telegram_user_id)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Сброс по внутреннему users.id (так его сообщает repo)."""
+        with self._lock:
+            telegram_user_id = self._by_user_id.get(user_id)
+            if telegram_user_id is not None:
+                self._drop(telegram_user_id)
+
+    def _drop(self, telegram_user_id: int) -> None:
+        item = self._items.pop(telegram_user_id, None)
+        if item is not None:
+            self._by_user_id.pop(int(item[0]["id"]), None)
+
+
+user_cache = UserCache()
+repo.add_user_listener(user_cache.invalidate_user)
+
+
+class UserMiddleware(BaseMiddleware):
+    """
+    Outer-middleware: один раз на апдейт находит (или создаёт) пользователя
+    и кладёт строку users в data["user"] — хендлеры получают её аргументом user.
+    """
+
+    def __init__(self, cache: UserCache = user_cache):
+        self.cache = cache
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        tg_user = data.get("event_from_user")
+        if tg_user is not None:
+            data["user"] = await self._resolve(tg_user.id, tg_user.username)
+        return await handler(event, data)
+
+    async def _resolve(self, telegram_user_id: int, username: str | None):
+        user = self.cache.get(telegram_user_id)
+        if user is not None and user["username"] == username:
+            return user
+
+        user = await async_repo.get_or_create_user(telegram_user_id, username)
+        if user["username"] != username:
+            # сменил username — обновляем; update_username сбросит кэш через слушателя
+            await async_repo.update_username(user["id"], username)
+            user = await async_repo.get_user_by_id(user["id"])
+        self.cache.put(telegram_user_id, user)
+        return user
@@ -3,14 +3,18 @@ from datetime import datetime
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from typing import Tuple, Optional, List
 
-from app.db import repo
+from app.db import async_repo
+from app.services import callback_data as cbd
+from app.services.callback_data import Cursor
+from app.services.quiet_hours import zone
+from app.services.render_cache import list_views
 
 
-def format_ts(ts: float | None) -> str:
+def format_ts(ts: float | None, tz: str | None = None) -> str:
     if not ts:
         return "—"
-    # храним UTC (time.time), форматируем просто, без TZ
-    return datetime.utcfromtimestamp(ts).strftime("%Y-%m-%d %H:%M")
+    # храним UTC (time.time), показываем в часовом поясе пользователя (users.timezone)
+    return datetime.fromtimestamp(ts, zone(tz)).strftime("%Y-%m-%d %H:%M")
 
 
 def clamp_page(page: int, pages: int) -> int:
@@ -30,29 +34,86 @@ def _chunk_buttons(btns: List[InlineKeyboardButton], per_row: int = 8) -> List[L
     return rows
 
 
-def build_list_view(
+async def _load_page(user_id: int, cursor: Optional[Cursor], backward: bool, limit: int):
+    # берём на одну строку больше — так видно, есть ли ещё страница в эту сторону
+    rows, total = await async_repo.list_open_page(user_id, cursor, limit + 1, backward=backward)
+    more = len(rows) > limit
+    if more:
+        rows = rows[1:] if backward else rows[:limit]
+    return rows, total, more
+
+
+async def build_list_view(
     user_id: int,
     page: int = 0,
     limit: int = 5,
     selected_task_id: Optional[int] = None,
+    cursor: Optional[Cursor] = None,
+    backward: bool = False,
+    tz: Optional[str] = None,
+) -> Tuple[str, InlineKeyboardMarkup]:
+    """
+    Страница /list. cursor — позиция keyset-пагинации (см. repo.list_open_page):
+    без backward страница начинается строго после cursor, с backward — заканчивается строго до него.
+    page нужен только для подписи «Страница N из M», tz — часовой пояс для дат (users.timezone).
+    Готовые страницы кэшируются до следующей записи в данные пользователя.
+    """
+    view_key = (page, limit, selected_task_id, cursor, backward, tz)
+    view = list_views.get(user_id, view_key)
+    if view is not None:
+        return view
+
+    # версию берём до чтения из БД: запись во время рендера сделает кэш устаревшим, а не «новым»
+    version = list_views.versions.get(user_id)
+    view = await _render_list_view(user_id, page, limit, selected_task_id, cursor, backward, tz)
+    list_views.put(user_id, view_key, version, view)
+    return view
+
+
+async def _render_list_view(
+    user_id: int,
+    page: int,
+    limit: int,
+    selected_task_id: Optional[int],
+    cursor: Optional[Cursor],
+    backward: bool,
+    tz: Optional[str],
 ) -> Tuple[str, InlineKeyboardMarkup]:
     # нормализация входа
     if limit <= 0:
         limit = 5
     page = max(0, page)
 
-    total = repo.count_open(user_id)
+    rows, total, more = await _load_page(user_id, cursor, backward, limit)
     if total == 0:
         text = "📭 Задач нет. Добавь первую командой /add"
         return text, InlineKeyboardMarkup(inline_keyboard=[])
 
+    if backward:
+        has_prev, has_next = more, True
+        if not more:
+            # упёрлись в начало списка — показываем полную первую страницу
+            rows, total, has_next = await _load_page(user_id, None, False, limit)
+            page = 0
+    else:
+        has_prev, has_next = page > 0, more
+        if not rows:
+            # страница опустела (задачи выполнены/удалены) — показываем хвост списка
+            rows, total, has_prev = await _load_page(user_id, cursor, True, limit)
+            has_next = False
+            page = (total + limit - 1) // limit - 1
+
     pages = (total + limit - 1) // limit
     page = clamp_page(page, pages)
-    offset = page * limit
+    if not has_prev:
+        page = 0
+    elif not has_next:
+        page = pages - 1
 
-    rows = repo.list_open_paged(user_id, offset, limit)
-    if rows:
-        print("DEBUG row keys:", list(rows[0].keys()))
+    # курсор «эта же страница» для перерисовки после действий с задачей:
+    # всё, что строго после (ts первой строки, id первой строки - 1)
+    first, last = rows[0], rows[-1]
+    here = (first["next_reminder_at"], first["id"] - 1)
 
     # Заголовок
     header_lines = [
@@ -69,13 +130,13 @@ def build_list_view(
         prefix = "→ " if is_selected else ""
         info = [
             f"{prefix}{i}) {row['task_name']}",
-            f"   След. напоминание: {format_ts(row['next_reminder_at'])}",
+            f"   След. напоминание: {format_ts(row['next_reminder_at'], tz)}",
             f"   Интервал: {int(row['interval'])} мин",
         ]
         if row["task_note"]:
             info.append(f"   Заметка: {row['task_note']}")
         if row["paused_until"]:
-            info.append(f"   Отложено до: {format_ts(row['paused_until'])}")
+            info.append(f"   Отложено до: {format_ts(row['paused_until'], tz)}")
         body_lines.append("\n".join(info))
 
     text = "\n".join(header_lines + body_lines) or "📭 Задач нет."
@@ -89,7 +150,7 @@ def build_list_view(
             number_buttons.append(
                 InlineKeyboardButton(
                     text=str(i),
-                    callback_data=f"select_task|{row['id']}|{page}|{limit}",
+                    callback_data=cbd.encode(cbd.SELECT, page, limit, here, task_id=row["id"]),
                 )
             )
         kb_rows.extend(_chunk_buttons(number_buttons, per_row=8))
@@ -97,26 +158,32 @@ def build_list_view(
         # Рисуем действия для выбранной задачи
         tid = selected_task_id
         kb_rows.append([
-            InlineKeyboardButton(text="✅ Выполнено", callback_data=f"task_done|{tid}|{page}|{limit}")
+            InlineKeyboardButton(text="✅ Выполнено", callback_data=cbd.encode(cbd.DONE, page, limit, here, task_id=tid))
         ])
         kb_rows.append([
-            InlineKeyboardButton(text="⏱ +15м", callback_data=f"task_snooze|{tid}|15|{page}|{limit}"),
-            InlineKeyboardButton(text="⏱ +1ч",  callback_data=f"task_snooze|{tid}|60|{page}|{limit}"),
-            InlineKeyboardButton(text="⏱ +1д",  callback_data=f"task_snooze|{tid}|1440|{page}|{limit}"),
+            InlineKeyboardButton(text="⏱ +15м", callback_data=cbd.encode(cbd.SNOOZE, page, limit, here, task_id=tid, minutes=15)),
+            InlineKeyboardButton(text="⏱ +1ч",  callback_data=cbd.encode(cbd.SNOOZE, page, limit, here, task_id=tid, minutes=60)),
+            InlineKeyboardButton(text="⏱ +1д",  callback_data=cbd.encode(cbd.SNOOZE, page, limit, here, task_id=tid, minutes=1440)),
         ])
         kb_rows.append([
-            InlineKeyboardButton(text="🗑 Удалить", callback_data=f"task_delete|{tid}|{page}|{limit}")
+            InlineKeyboardButton(text="🗑 Удалить", callback_data=cbd.encode(cbd.DELETE, page, limit, here, task_id=tid))
         ])
         kb_rows.append([
-            InlineKeyboardButton(text="⬅️ Назад", callback_data=f"back_to_list|{page}|{limit}")
+            InlineKeyboardButton(text="⬅️ Назад", callback_data=cbd.encode(cbd.BACK, page, limit, here))
         ])
 
     # Пагинация (всегда внизу)
     nav_row: List[InlineKeyboardButton] = []
-    if page > 0:
-        nav_row.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"list_page|{page - 1}|{limit}"))
-    if page < pages - 1:
-        nav_row.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=f"list_page|{page + 1}|{limit}"))
+    if has_prev:
+        prev_cursor = (first["next_reminder_at"], first["id"])
+        nav_row.append(InlineKeyboardButton(
+            text="⬅️ Назад", callback_data=cbd.encode(cbd.PAGE, page - 1, limit, prev_cursor, backward=True),
+        ))
+    if has_next:
+        next_cursor = (last["next_reminder_at"], last["id"])
+        nav_row.append(InlineKeyboardButton(
+            text="Вперёд ➡️", callback_data=cbd.encode(cbd.PAGE, page + 1, limit, next_cursor),
+        ))
     if nav_row:
         kb_rows.append(nav_row)
 
@@ -124,14 +191,14 @@ def build_list_view(
     return text, keyboard
 
 
-def add_task_service(user_id: int, task_name: str, notes: str | None, interval: int) -> str:
+async def add_task_service(user_id: int, task_name: str, notes: str | None, interval: int) -> str:
     # валидация входа
     if not task_name or not task_name.strip():
         raise ValueError("Название задачи пустое")
-    # if interval <= 0:
-    #   raise ValueError("Интервал должен быть больше 0")
+    if interval <= 0:
+        raise ValueError("Интервал должен быть больше 0")
 
-    task_id = repo.add_task(user_id, task_name.strip(), notes, interval)
+    task_id = await async_repo.add_task(user_id, task_name.strip(), notes, interval)
     return f"✅ Задача добавлена (ID: {task_id}). Следующее напоминание через {interval} минут."
 
 
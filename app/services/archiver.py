@@ -0,0 +1,62 @@
+# app/services/archiver.py
+"""
+Фоновая архивация: закрытые задачи (status = 0) переезжают из tasks в tasks_archive,
+чтобы горячая таблица и её индексы росли с числом активных задач, а не со всей историей.
+
+Переносим пачками по batch_size в отдельных коротких транзакциях с паузой между ними —
+планировщик и хендлеры не ждут блокировку записи. После прохода incremental vacuum
+возвращает освободившиеся страницы файлу (если база в режиме auto_vacuum = INCREMENTAL).
+"""
+import asyncio
+import logging
+import time
+
+from app.db import async_repo
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+# Закрытая задача ещё день остаётся в tasks: кнопки под старыми сообщениями продолжают работать
+GRACE_SECONDS = 24 * 3600
+
+
+async def archive_once(
+    batch_size: int = 500,
+    grace_seconds: float = GRACE_SECONDS,
+    pause_seconds: float = 0.05,
+    vacuum_pages: int = 0,
+) -> tuple[int, int]:
+    """Один проход: переносит всё, что пора, затем vacuum. Возвращает (перенесено задач, освобождено байт)."""
+    before = time.time() - grace_seconds
+    archived = 0
+    while True:
+        moved = await async_repo.archive_closed(before, batch_size)
+        archived += moved
+        metrics.archived_total.inc(moved)
+        if moved < batch_size:
+            break
+        await asyncio.sleep(pause_seconds)
+
+    reclaimed = await async_repo.incremental_vacuum(vacuum_pages)
+    metrics.vacuum_reclaimed.inc(reclaimed)
+    return archived, reclaimed
+
+
+async def run(
+    interval_seconds: float = 3600,
+    batch_size: int = 500,
+    grace_seconds: float = GRACE_SECONDS,
+    vacuum_pages: int = 0,
+    quiet: bool = True,
+) -> None:
+    """Бесконечный цикл: archive_once раз в interval_seconds. Можно запускать в каждом процессе."""
+    while True:
+        try:
+            archived, reclaimed = await archive_once(batch_size, grace_seconds, vacuum_pages=vacuum_pages)
+            if not quiet and (archived or reclaimed):
+                log.info("archived %d closed tasks, vacuum reclaimed %.1f KiB", archived, reclaimed / 1024)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("archiver pass failed")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,182 @@
+# app/services/callback_data.py
+"""
+callback_data кнопок /list: компактная версионированная строка <-> ListAction.
+
+Формат v1: "1" + код действия (одна буква) + поля через ".":
+целые — в base36, курсор — "-" или направление ("<" / ">") + 8 байт ts в base64url (11 символов) + id в base36.
+ts кодируется без потерь: keyset-пагинация сравнивает его на строгое равенство.
+Выходит до ~35 байт против ~55 у старого "task_snooze|123|60|0|>1760000000.123456:122|5"
+— в лимит Telegram (64 байта) остаётся место.
+
+Кнопки под уже отправленными сообщениями живут в чатах бессрочно, поэтому старые форматы через "|"
+тоже разбираются: исходный постраничный ("task_snooze|{id}|{minutes}|{page}|{limit}") и с курсором вместо
+смещения ("task_snooze|{id}|{minutes}|{page}|{cursor}|{limit}"). Номер страницы на keyset-курсор
+не переводится, поэтому постраничные кнопки открывают первую страницу; действие с задачей выполняется как есть.
+"""
+import base64
+import math
+import struct
+from typing import NamedTuple, Optional, Tuple
+
+Cursor = Tuple[float, int]
+
+VERSION = "1"
+_SEP = "."
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+# коды действий
+PAGE = "p"
+SELECT = "s"
+DONE = "d"
+SNOOZE = "z"
+DELETE = "x"
+BACK = "b"
+
+# поля после кода, по действиям
+_FIELDS = {
+    PAGE: ("page", "cursor", "limit"),
+    SELECT: ("task_id", "page", "cursor", "limit"),
+    DONE: ("task_id", "page", "cursor", "limit"),
+    SNOOZE: ("task_id", "minutes", "page", "cursor", "limit"),
+    DELETE: ("task_id", "page", "cursor", "limit"),
+    BACK: ("page", "cursor", "limit"),
+}
+
+# старые имена действий; поля те же, что в _FIELDS, курсора у постраничных кнопок нет
+_LEGACY = {
+    "list_page": PAGE,
+    "select_task": SELECT,
+    "task_done": DONE,
+    "task_snooze": SNOOZE,
+    "task_delete": DELETE,
+    "back_to_list": BACK,
+}
+
+MAX_LIMIT = 50
+MAX_SNOOZE_MINUTES = 366 * 24 * 60
+# id уходят в запросы к SQLite: больше INTEGER sqlite3 не привяжет (OverflowError)
+MAX_ID = 2 ** 63 - 1
+
+
+class ListAction(NamedTuple):
+    action: str
+    page: int = 0
+    limit: int = 5
+    cursor: Optional[Cursor] = None
+    backward: bool = False
+    task_id: Optional[int] = None
+    minutes: Optional[int] = None
+
+
+def _check_id(n: int) -> int:
+    if not 0 <= n <= MAX_ID:
+        raise ValueError("id out of range")
+    return n
+
+
+def _check_cursor(cursor: Cursor) -> None:
+    # ts — next_reminder_at: конечное неотрицательное число (NaN sqlite3 привязал бы как NULL)
+    ts, task_id = cursor
+    if not (math.isfinite(ts) and ts >= 0):
+        raise ValueError("cursor ts out of range")
+    _check_id(task_id)
+
+
+# ---- кодирование ----
+def _b36(n: int) -> str:
+    if n < 0:
+        raise ValueError("negative field")
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = _DIGITS[r] + out
+        if not n:
+            return out
+
+
+def _encode_cursor(cursor: Optional[Cursor], backward: bool) -> str:
+    if cursor is None:
+        return "-"
+    _check_cursor(cursor)
+    ts, task_id = cursor
+    packed = base64.urlsafe_b64encode(struct.pack(">d", ts)).rstrip(b"=").decode()
+    return ("<" if backward else ">") + packed + _b36(task_id)
+
+
+def encode(action: str, page: int = 0, limit: int = 5, cursor: Optional[Cursor] = None,
+           backward: bool = False, task_id: Optional[int] = None, minutes: Optional[int] = None) -> str:
+    if task_id is not None:
+        _check_id(task_id)
+    values = {"page": page, "limit": limit, "task_id": task_id, "minutes": minutes}
+    parts = []
+    for name in _FIELDS[action]:
+        parts.append(_encode_cursor(cursor, backward) if name == "cursor" else _b36(values[name]))
+    return VERSION + action + _SEP.join(parts)
+
+
+# ---- разбор ----
+def _decode_cursor(token: str) -> Tuple[Optional[Cursor], bool]:
+    if token == "-":
+        return None, False
+    if token[:1] not in ("<", ">") or len(token) < 13:
+        raise ValueError("bad cursor")
+    (ts,) = struct.unpack(">d", base64.urlsafe_b64decode(token[1:12] + "="))
+    return (ts, int(token[12:], 36)), token[0] == "<"
+
+
+def _decode_legacy_cursor(token: str) -> Tuple[Optional[Cursor], bool]:
+    # v0: '>ts:id' / '<ts:id' / '-'
+    if token == "-":
+        return None, False
+    if token[:1] not in ("<", ">"):
+        raise ValueError("bad cursor")
+    ts, task_id = token[1:].split(":")
+    return (float(ts), int(task_id)), token[0] == "<"
+
+
+def _build(action: str, raw: list[str], legacy: bool) -> ListAction:
+    fields = _FIELDS[action]
+    if len(raw) != len(fields):
+        raise ValueError("wrong field count")
+    values = {}
+    for name, token in zip(fields, raw):
+        if name == "cursor":
+            values["cursor"], values["backward"] = (_decode_legacy_cursor if legacy else _decode_cursor)(token)
+        else:
+            values[name] = int(token) if legacy else int(token, 36)
+    act = ListAction(action, **values)
+    if act.page < 0 or not 0 < act.limit <= MAX_LIMIT:
+        raise ValueError("page/limit out of range")
+    if act.minutes is not None and not 0 < act.minutes <= MAX_SNOOZE_MINUTES:
+        raise ValueError("minutes out of range")
+    if act.task_id is not None:
+        _check_id(act.task_id)
+    if act.cursor is not None:
+        _check_cursor(act.cursor)
+    return act
+
+
+def _build_paged(action: str, raw: list[str]) -> ListAction:
+    # "list_page|{page}|{limit}" и т.п.: курсора нет — первая страница
+    raw = list(raw)
+    raw.insert(_FIELDS[action].index("cursor"), "-")
+    return _build(action, raw, legacy=True)._replace(page=0)
+
+
+def decode(data: Optional[str]) -> Optional[ListAction]:
+    """ListAction из callback_data или None, если строка не наша или испорчена."""
+    if not data:
+        return None
+    try:
+        if data[0] == VERSION and len(data) > 1 and data[1] in _FIELDS:
+            return _build(data[1], data[2:].split(_SEP), legacy=False)
+        name, _, rest = data.partition("|")
+        action = _LEGACY.get(name)
+        if action is not None:
+            raw = rest.split("|")
+            if len(raw) == len(_FIELDS[action]) - 1:
+                return _build_paged(action, raw)
+            return _build(action, raw, legacy=True)
+    except (ValueError, TypeError, struct.error):
+        return None
+    return None
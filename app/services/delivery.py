@@ -0,0 +1,467 @@
+# app/services/delivery.py
+import asyncio
+import collections
+import itertools
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramMigrateToChat,
+    TelegramNotFound,
+    TelegramRetryAfter,
+)
+
+from app.db import async_repo
+from . import metrics
+from .tasks import deliver_reminder, missed_occurrences, next_reminder_ts, reminder_text
+
+log = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений/сек на бота и не больше 1 сообщения/сек в один чат.
+# Оба берём с запасом, чтобы не ловить flood-wait: разброс задержки сети сжимает интервалы
+# между отправками, а запас глобального ведра на старте ушёл бы разом поверх ровного темпа.
+GLOBAL_RATE = 25.0
+GLOBAL_BURST = 2.0
+PER_CHAT_RATE = 0.9
+
+# 429 от стольких разных чатов за FLOOD_WINDOW секунд — упёрлись в общий лимит бота,
+# а не в лимит одного чата: тогда на паузу встаёт весь глобальный бюджет
+FLOOD_CHATS = 3
+FLOOD_WINDOW = 1.0
+
+# На сколько секунд воркер захватывает строки; пока они в полёте, захват продлевается.
+# Если процесс упал, через столько же секунд его строки заберут другие.
+LEASE_SECONDS = 60.0
+
+
+# Что делать со сроками, пропущенными целиком (бот лежал, бэклог):
+# skip — при старте молча перенести задачи на ближайший будущий срок (repo.skip_missed);
+# summary — отправить одно напоминание с числом пропущенных и дальше идти по сетке.
+CATCHUP_SKIP = "skip"
+CATCHUP_SUMMARY = "summary"
+CATCHUP_POLICIES = (CATCHUP_SKIP, CATCHUP_SUMMARY)
+
+# Повторы неудачных отправок: экспоненциальный backoff с джиттером, после MAX_ATTEMPTS — failed.
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 3600.0
+# Как часто смотреть в outbox за сообщениями, которым пора на повтор
+RETRY_POLL_SECONDS = 2.0
+# Сколько хранить sent/failed в outbox (для разбора), потом удаляем
+OUTBOX_KEEP_SECONDS = 7 * 24 * 3600
+
+# Приоритеты в очереди отправки: повторы, которым подошёл срок, идут раньше свежего бэклога,
+# иначе при большом бэклоге они ждали бы, пока тот разгребётся
+_PRIORITY_RETRY = 0
+_PRIORITY_FRESH = 1
+
+# Ошибки, после которых повторять бессмысленно: бота заблокировали, чата нет, кривой запрос
+_PERMANENT_ERRORS = (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound, TelegramMigrateToChat)
+
+
+def backoff_delay(attempts: int) -> float:
+    """Пауза перед попыткой номер attempts + 1: base * 2^(attempts-1), не больше BACKOFF_MAX, джиттер 50–100%."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def make_worker_id() -> str:
+    """Уникальное имя воркера планировщика: хост, pid и случайный хвост (pid мог достаться после рестарта)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity в запасе."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        # во время паузы _updated в будущем — токены не копятся
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self._tokens >= self.capacity
+
+    def pause(self, seconds: float) -> None:
+        """Никому не выдавать токены seconds секунд (retry_after от Telegram); запас обнуляется."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+    def wait_time(self) -> float:
+        """Через сколько секунд появится токен (0 — уже есть); сам токен не берёт."""
+        wait = self._paused_until - time.monotonic()
+        if wait > 0:
+            return wait
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    def try_acquire(self) -> bool:
+        """Берёт токен, если он есть прямо сейчас, не дожидаясь."""
+        if self.wait_time() > 0:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def acquire(self) -> None:
+        while True:
+            wait = self._paused_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _Batch:
+    """Сообщения outbox, взятые за раз: когда обработаны все, итог пишется одной транзакцией."""
+    __slots__ = ("remaining", "ids", "sent", "retry", "failed")
+
+    def __init__(self, ids: list[int]):
+        self.remaining = len(ids)
+        self.ids = ids
+        self.sent: list[tuple[int, int, float]] = []
+        self.retry: list[tuple[int, int, float, str | None]] = []
+        self.failed: list[tuple[int, str]] = []
+
+
+class DeliveryPipeline:
+    """
+    Очередь отправки напоминаний с пулом воркеров.
+    Тик планировщика отдаёт захваченные задачи (repo.claim_due) в submit: они одной транзакцией
+    превращаются в сообщения outbox, а задачи переносятся на следующий срок. Тик не ждёт отправки,
+    поэтому следующий тик может начаться, пока предыдущие сообщения ещё в полёте.
+    Сообщение, которое не ушло, возвращается в outbox с backoff (retry_after от Telegram ставит
+    на паузу чат, а если 429 идут от нескольких чатов сразу — весь глобальный бюджет)
+    и подбирается отдельным циклом, когда подойдёт срок, —
+    одна проблемная отправка не держит остальные и не выбирается заново на каждом тике.
+    Пока сообщения в полёте, их захват продлевается.
+    Воркер не ждёт лимита одного чата: сообщение в чат, который ещё не может принять следующее,
+    откладывается в очередь этого чата и возвращается в общую по таймеру, а воркер берёт следующее.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        concurrency: int = 8,
+        global_rate: float = GLOBAL_RATE,
+        per_chat_rate: float = PER_CHAT_RATE,
+        queue_size: int = 1000,
+        owner: str | None = None,
+        lease_seconds: float = LEASE_SECONDS,
+        catch_up: str = CATCHUP_SUMMARY,
+    ):
+        if concurrency <= 0:
+            raise ValueError("concurrency must be > 0")
+        if lease_seconds <= 0:
+            raise ValueError("lease_seconds must be > 0")
+        if catch_up not in CATCHUP_POLICIES:
+            raise ValueError(f"unknown catch-up policy: {catch_up}")
+        self.bot = bot
+        self.owner = owner or make_worker_id()
+        self.lease_seconds = lease_seconds
+        self.catch_up = catch_up
+        self.concurrency = concurrency
+        self.per_chat_rate = per_chat_rate
+        self._global = TokenBucket(global_rate, capacity=GLOBAL_BURST)
+        self._chats: dict[int, TokenBucket] = {}
+        # сообщения, ждущие лимита своего чата (по порядку), и таймеры их возврата в очередь
+        self._parked: dict[int, collections.deque] = {}
+        self._timers: dict[int, asyncio.TimerHandle] = {}
+        self._requeues: set[asyncio.Task] = set()
+        # чат -> когда (monotonic) он последний раз получил 429
+        self._flood: dict[int, float] = {}
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize=queue_size)
+        self._seq = itertools.count()
+        # id сообщений outbox, которые сейчас в очереди или отправляются
+        self._in_flight: set[int] = set()
+        self._open_batches: set[_Batch] = set()
+        self._workers: list[asyncio.Task] = []
+        self._background: list[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+        # скользящее среднее длительности одной отправки (сек), для адаптивного батча
+        self.avg_latency = 0.0
+
+    # ---- жизненный цикл ----
+    def start(self) -> None:
+        if self._workers:
+            return
+        for i in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"delivery-{i}"))
+        self._background = [
+            asyncio.create_task(self._renew_loop(), name="delivery-leases"),
+            asyncio.create_task(self._retry_loop(), name="delivery-retries"),
+        ]
+
+    async def stop(self) -> None:
+        for timer in self._timers.values():
+            timer.cancel()
+        tasks = [*self._workers, *self._background, *self._requeues]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers.clear()
+        self._background.clear()
+        self._timers.clear()
+        self._parked.clear()
+        # итог по уже отправленным пишем — иначе после рестарта уйдут повторно;
+        # неотправленные возвращаются в pending
+        for batch in list(self._open_batches):
+            await self._finish(batch)
+
+    async def join(self) -> None:
+        """Ждёт, пока не опустеют очередь и отложенные по чатам сообщения (удобно в тестах и при остановке)."""
+        while True:
+            await self._queue.join()
+            if not self._parked and not self._requeues:
+                return
+            await asyncio.sleep(0.05)
+
+    # ---- приём задач ----
+    @property
+    def pending(self) -> int:
+        return len(self._in_flight)
+
+    async def submit(self, rows) -> int:
+        """
+        Превращает захваченные задачи в сообщения outbox и ставит их в очередь отправки.
+        Задача, по которой ещё висит неотправленное сообщение, нового не получает.
+        Возвращает, сколько сообщений реально поставлено.
+        """
+        if not rows:
+            return 0
+        now = time.time()
+        summary = self.catch_up == CATCHUP_SUMMARY
+        items = [
+            (row["id"], row["user_id"], row["chat_id"],
+             reminder_text(row, missed_occurrences(row, now) if summary else 0),
+             max(row["next_reminder_at"], row["paused_until"] or 0), next_reminder_ts(row, now))
+            for row in rows
+        ]
+        created = await async_repo.enqueue_outbox(self.owner, items, self.lease_seconds)
+        return await self._put(created, _PRIORITY_FRESH)
+
+    async def _put(self, messages, priority: int) -> int:
+        fresh = [m for m in messages if m["id"] not in self._in_flight]
+        if not fresh:
+            return 0
+        batch = _Batch([m["id"] for m in fresh])
+        self._in_flight.update(batch.ids)
+        self._open_batches.add(batch)
+        for message in fresh:
+            await self._queue.put((priority, next(self._seq), batch, message, False))
+        return len(fresh)
+
+    # ---- отправка ----
+    def _chat_bucket(self, chat_key: int) -> TokenBucket:
+        bucket = self._chats.get(chat_key)
+        if bucket is None:
+            if len(self._chats) > 10_000:
+                self._prune_chats()
+            bucket = TokenBucket(self.per_chat_rate, capacity=1)
+            self._chats[chat_key] = bucket
+        return bucket
+
+    def _prune_chats(self) -> None:
+        # полные вёдра ничего не помнят — их можно выбросить
+        for key in [k for k, b in self._chats.items() if k not in self._parked and b.is_full()]:
+            del self._chats[key]
+
+    def _defer(self, entry, chat_key: int) -> bool:
+        """
+        Откладывает сообщение, если его чат сейчас не может принять следующее; True — отложено.
+        Пока у чата есть отложенные, новые встают за ними, чтобы не менять порядок.
+        """
+        parked = self._parked.get(chat_key)
+        if parked is not None and not entry[4]:
+            parked.append(entry)
+            return True
+        wait = self._chat_bucket(chat_key).wait_time()
+        if not wait:
+            return False
+        self._park(chat_key, entry, wait)
+        return True
+
+    def _park(self, chat_key: int, entry, wait: float) -> None:
+        # сюда попадает первое сообщение чата в очереди — встаёт в начало
+        priority, seq, batch, message, _ = entry
+        self._parked.setdefault(chat_key, collections.deque()).appendleft((priority, seq, batch, message, False))
+        if chat_key not in self._timers:
+            self._timers[chat_key] = asyncio.get_running_loop().call_later(wait, self._release_chat, chat_key)
+
+    def _release_chat(self, chat_key: int) -> None:
+        # самое старое отложенное — обратно в очередь, помеченное, чтобы не встать за остальными
+        parked = self._parked[chat_key]
+        priority, seq, batch, message, _ = parked.popleft()
+        self._requeue((priority, seq, batch, message, True))
+        if parked:
+            self._timers[chat_key] = asyncio.get_running_loop().call_later(
+                1 / self.per_chat_rate, self._release_chat, chat_key
+            )
+        else:
+            del self._parked[chat_key]
+            del self._timers[chat_key]
+
+    def _requeue(self, entry) -> None:
+        # место в очереди могли занять, пока сообщение ждало, — тогда встаём в неё фоном
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            task = asyncio.create_task(self._queue.put(entry))
+            self._requeues.add(task)
+            task.add_done_callback(self._requeues.discard)
+
+    def _observe_latency(self, seconds: float) -> None:
+        if self.avg_latency == 0.0:
+            self.avg_latency = seconds
+        else:
+            self.avg_latency += 0.1 * (seconds - self.avg_latency)
+
+    @property
+    def max_rate(self) -> float:
+        """Сколько сообщений в секунду pipeline способен отправить при текущей задержке."""
+        if self.avg_latency <= 0:
+            return self._global.rate
+        return min(self._global.rate, self.concurrency / self.avg_latency)
+
+    # ---- outbox ----
+    async def _renew_loop(self) -> None:
+        # продлеваем заранее: треть срока — запас на медленную БД
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not self._in_flight:
+                continue
+            try:
+                await async_repo.renew_outbox(self.owner, list(self._in_flight), time.time() + self.lease_seconds)
+            except Exception:
+                log.exception("lease renewal failed for %d messages", len(self._in_flight))
+
+    async def _retry_loop(self) -> None:
+        """Подбирает из outbox сообщения, которым подошёл срок повтора, и брошенные упавшими воркерами."""
+        purged_at = 0.0
+        while True:
+            await asyncio.sleep(RETRY_POLL_SECONDS)
+            try:
+                # даже при полной очереди берём немного: повторы встанут в её начало
+                room = max(10, self._queue.maxsize - self._queue.qsize())
+                await self._put(await async_repo.claim_outbox(
+                    self.owner, time.time(), min(room, 100), self.lease_seconds
+                ), _PRIORITY_RETRY)
+                if time.time() - purged_at >= 3600:
+                    await async_repo.purge_outbox(time.time() - OUTBOX_KEEP_SECONDS)
+                    purged_at = time.time()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("outbox retry poll failed")
+
+    def _flood_is_global(self, chat_key: int) -> bool:
+        """Запоминает 429 чата; True, если за FLOOD_WINDOW их получили FLOOD_CHATS разных чатов."""
+        now = time.monotonic()
+        self._flood[chat_key] = now
+        for key in [k for k, t in self._flood.items() if t < now - FLOOD_WINDOW]:
+            del self._flood[key]
+        return len(self._flood) >= FLOOD_CHATS
+
+    def _on_error(self, batch: _Batch, message, exc: Exception) -> None:
+        """Решает судьбу неудачной отправки: повтор с паузой или failed."""
+        error = f"{type(exc).__name__}: {exc}"[:500]
+        if isinstance(exc, TelegramRetryAfter):
+            # тормозим только этот чат, остальные идут дальше; попытку не засчитываем
+            chat_key = message["chat_id"]
+            self._chat_bucket(chat_key).pause(exc.retry_after)
+            if self._flood_is_global(chat_key):
+                self._global.pause(exc.retry_after)
+                log.warning("flood control from %d chats, pausing all sends for %ss",
+                            len(self._flood), exc.retry_after)
+            else:
+                log.warning("flood control in chat %s, pausing it for %ss", chat_key, exc.retry_after)
+            metrics.flood_wait.inc(exc.retry_after)
+            metrics.send_retries.inc()
+            batch.retry.append((message["id"], 0, time.time() + exc.retry_after, error))
+            return
+        attempts = message["attempts"] + 1
+        if isinstance(exc, _PERMANENT_ERRORS) or attempts >= MAX_ATTEMPTS:
+            metrics.send_dead.inc()
+            batch.failed.append((message["id"], error))
+            log.warning("reminder %s (task %s) failed for good after %d attempts: %s",
+                        message["id"], message["task_id"], attempts, error)
+            return
+        delay = backoff_delay(attempts)
+        metrics.send_retries.inc()
+        batch.retry.append((message["id"], 1, time.time() + delay, error))
+        log.warning("reminder %s (task %s) attempt %d failed, retry in %.0fs: %s",
+                    message["id"], message["task_id"], attempts, delay, error)
+
+    async def _finish(self, batch: _Batch) -> None:
+        # не дошедшие до отправки (остановка) — обратно в pending без штрафа
+        handled = {m[0] for m in batch.sent} | {m[0] for m in batch.retry} | {m[0] for m in batch.failed}
+        now = time.time()
+        batch.retry.extend((i, 0, now, None) for i in batch.ids if i not in handled)
+        try:
+            await async_repo.settle_outbox(self.owner, batch.sent, batch.retry, batch.failed)
+        except Exception:
+            # не записалось — после истечения захвата сообщения уйдут ещё раз (лучше дубль, чем потеря)
+            log.exception("outbox settle failed for %d messages", len(batch.ids))
+        finally:
+            self._in_flight.difference_update(batch.ids)
+            self._open_batches.discard(batch)
+
+    async def _worker(self) -> None:
+        while True:
+            entry = await self._queue.get()
+            _, _, batch, message, _ = entry
+            chat_key = message["chat_id"]
+            # чат упёрся в свой лимит — сообщение ждёт отдельно, воркер берёт следующее
+            if self._defer(entry, chat_key):
+                self._queue.task_done()
+                continue
+            parked = False
+            try:
+                await self._global.acquire()
+                # токен чата берём прямо перед отправкой: взятый до ожидания глобального бюджета
+                # позволил бы двум сообщениям одного чата уйти подряд, когда бюджет освободится
+                bucket = self._chat_bucket(chat_key)
+                if not bucket.try_acquire():
+                    # пока ждали, чат занял другой воркер; глобальный токен пропадает — это редкость
+                    self._park(chat_key, entry, bucket.wait_time())
+                    parked = True
+                    continue
+                started = time.monotonic()
+                await deliver_reminder(self.bot, message)
+                self._observe_latency(time.monotonic() - started)
+                self.sent += 1
+                batch.sent.append((message["id"], message["task_id"], time.time()))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                self._on_error(batch, message, e)
+            finally:
+                if not parked:
+                    batch.remaining -= 1
+                    if batch.remaining == 0:
+                        await self._finish(batch)
+                self._queue.task_done()
@@ -0,0 +1,96 @@
+# app/services/due_heap.py
+import asyncio
+import heapq
+import threading
+
+
+class DueHeap:
+    """
+    In-memory расписание: min-heap из кортежей (due_at, task_id).
+    Изменения приходят через push() (слушатель repo) — старые записи в куче не ищем,
+    а отбрасываем лениво: актуальное время задачи хранится в _due.
+    push() потокобезопасен: repo вызывает его из потоков БД.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[float, int]] = []
+        self._due: dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def load(self, rows) -> None:
+        """Полностью пересобирает кучу из строк (id, user_id, due_at)."""
+        due = {int(r["id"]): float(r["due_at"]) for r in rows}
+        heap = [(ts, task_id) for task_id, ts in due.items()]
+        heapq.heapify(heap)
+        with self._lock:
+            self._due = due
+            self._heap = heap
+        self._wake()
+
+    # ---- слушатель repo: fn(task_id, user_id, due_at) ----
+    def push(self, task_id, user_id, due_at) -> None:
+        with self._lock:
+            if due_at is None:
+                self._due.pop(task_id, None)
+                return
+            due_at = float(due_at)
+            self._due[task_id] = due_at
+            heapq.heappush(self._heap, (due_at, task_id))
+            earliest = self._heap[0][0] == due_at
+            self._compact_if_needed()
+        if earliest:
+            # новый самый ранний срок — разбудить ожидание
+            self._wake()
+
+    def _wake(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._changed.set)
+
+    def _compact_if_needed(self) -> None:
+        # устаревших записей стало слишком много — пересобираем (под _lock)
+        if len(self._heap) > 2 * len(self._due) + 1024:
+            self._heap = [(ts, task_id) for task_id, ts in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def _drop_stale(self) -> None:
+        heap = self._heap
+        while heap and self._due.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def peek(self) -> float | None:
+        """Ближайший срок или None, если расписание пустое."""
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> list[int]:
+        """Снимает с кучи все задачи со сроком <= now и возвращает их id."""
+        out = []
+        with self._lock:
+            heap = self._heap
+            while True:
+                self._drop_stale()
+                if not heap or heap[0][0] > now:
+                    break
+                _, task_id = heapq.heappop(heap)
+                del self._due[task_id]
+                out.append(task_id)
+        return out
+
+    async def wait(self, timeout: float | None) -> None:
+        """Спит до timeout или до появления более раннего срока."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def clear_wakeup(self) -> None:
+        self._changed.clear()
@@ -0,0 +1,331 @@
+# app/services/duration.py
+"""
+Разбор длительности из свободного текста ("15 минут", "1,5 часа", "полчаса", "двадцать минут") в минуты.
+
+Строка один раз режется на токены предкомпилированным регулярным выражением,
+нормализация (через/спустя, минус, мин./часа/часов, "минут 20" -> "20 минут") идёт по списку токенов,
+а все формы ищутся за один проход по нему. Результаты для повторяющихся строк берутся из LRU-кэша.
+
+Поведение совпадает со старой цепочкой normalize() + parse_*() из app/handlers/add.py,
+включая её особенности (например, "1 час 30 минут" -> 1800): это зафиксировано корпусом
+bench/duration_corpus.tsv, проверяемым в bench/bench_duration.py.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Iterable
+
+RU_NUM = {
+    "ноль": 0,
+    "один": 1,
+    "два": 2,
+    "три": 3,
+    "четыре": 4,
+    "пять": 5,
+    "шесть": 6,
+    "семь": 7,
+    "восемь": 8,
+    "девять": 9,
+    "десять": 10,
+    "одинадцать": 11,
+    "двенадцать": 12,
+    "тринадцать": 13,
+    "четырнадцать": 14,
+    "пятнадцать": 15,
+    "двадцать": 20,
+    "тридцать": 30,
+    "сорок": 40,
+    "пятьдесят": 50
+}
+
+# Виды токенов = номера групп в _TOKEN_RE
+WS, NUM, WORD, PUNCT = 1, 2, 3, 4
+
+# пробелы | цифры | буквы (всё из \w, кроме цифр) | любой другой одиночный символ
+_TOKEN_RE = re.compile(r"(\s+)|(\d+)|([^\W\d]+)|(.)", re.S)
+
+_FILLERS = frozenset({"через", "спустя"})
+_HOUR_FORMS = frozenset({"час", "часа", "часов"})
+_MIN_FORMS = frozenset({"мин"})
+_MINUTE_UNITS = frozenset({"минут", "минута", "минуты"})
+_HALF_HOUR = "полчаса"
+_HOUR_AND_HALF = frozenset({"полторачас", "полторачаса", "полторачасов"})
+
+# Словесная форма ("двадцать пять минут", "- пять минут") разбирается по нормализованной строке —
+# до неё доходим только если числовые формы ничего не дали.
+_NEG_WORDS_RE = re.compile(r"(?:^|\s)-\s*([а-яё\s]+)\s*минут[аы]?\b")
+_WORDS_RE = re.compile(r"\b([а-яё\s]+)\s*минут[аы]?\b")
+
+
+def _is_w(tok) -> bool:
+    return tok[0] == NUM or tok[0] == WORD
+
+
+def _boundary_before(toks, i) -> bool:
+    # \b перед словом/числом: слева нет символа \w
+    return i == 0 or not _is_w(toks[i - 1])
+
+
+def _boundary_after(toks, i) -> bool:
+    return i + 1 >= len(toks) or not _is_w(toks[i + 1])
+
+
+def tokenize(s: str) -> list[list]:
+    """Токены [вид, текст] строки."""
+    return [[m.lastindex, m.group()] for m in _TOKEN_RE.finditer(s)]
+
+
+# ---- нормализация (по шагам старой normalize(), но на токенах) ----
+def _append(out: list[list], tok) -> None:
+    # соседние пробелы сливаются в один токен, слова тоже ("мин.пять" -> " минутпять")
+    if out and tok[0] == out[-1][0] and (tok[0] == WS or tok[0] == WORD):
+        out[-1] = [tok[0], out[-1][1] + tok[1]]
+    else:
+        out.append(tok)
+
+
+def _drop_fillers_and_minus(toks: list[list]) -> list[list]:
+    # "через"/"спустя" вместе с пробелами вокруг -> один пробел; "минус" и "−" -> "-"
+    out: list[list] = []
+    i, n = 0, len(toks)
+    while i < n:
+        kind, text = toks[i]
+        if kind == WORD and text in _FILLERS and _boundary_before(toks, i) and _boundary_after(toks, i):
+            if out and out[-1][0] == WS:
+                out.pop()
+            _append(out, [WS, " "])
+            i += 1
+            if i < n and toks[i][0] == WS:
+                i += 1
+            continue
+        if kind == WORD and text == "минус" and _boundary_before(toks, i) and _boundary_after(toks, i):
+            _append(out, [PUNCT, "-"])
+        elif kind == PUNCT and text == "−":
+            _append(out, [PUNCT, "-"])
+        else:
+            _append(out, toks[i])
+        i += 1
+    return out
+
+
+def _unify_unit(toks: list[list], forms, dot_form: str, unit: str) -> list[list]:
+    # \b(форма)\.?\b -> " unit"; точка после dot_form съедается, только если за ней сразу идёт буква/цифра
+    out: list[list] = []
+    i, n = 0, len(toks)
+    while i < n:
+        kind, text = toks[i]
+        if kind == WORD and text in forms and _boundary_before(toks, i):
+            nxt = toks[i + 1] if i + 1 < n else None
+            glued = (
+                text == dot_form
+                and nxt is not None and nxt[1] == "."
+                and i + 2 < n and _is_w(toks[i + 2])
+            )
+            if glued or nxt is None or not _is_w(nxt):
+                _append(out, [WS, " "])
+                _append(out, [WORD, unit])
+                i += 2 if glued else 1
+                continue
+        _append(out, toks[i])
+        i += 1
+    return out
+
+
+def _reorder(toks: list[list], unit: str) -> list[list]:
+    # "минут 20" -> "20 минут", "час -2" -> "-2 час"
+    out: list[list] = []
+    i, n = 0, len(toks)
+    while i < n:
+        tok = toks[i]
+        if (
+            tok[0] == WORD and tok[1] == unit and _boundary_before(toks, i)
+            and i + 2 < n and toks[i + 1][0] == WS
+        ):
+            j = i + 2
+            sign = None
+            if toks[j][1] == "-" and j + 1 < n:
+                sign, j = toks[j], j + 1
+            if toks[j][0] == NUM and _boundary_after(toks, j):
+                if sign is not None:
+                    _append(out, sign)
+                _append(out, toks[j])
+                _append(out, [WS, " "])
+                _append(out, tok)
+                i = j + 1
+                continue
+        _append(out, tok)
+        i += 1
+    return out
+
+
+def _collapse(toks: list[list]) -> list[list]:
+    out: list[list] = []
+    for tok in toks:
+        if tok[0] == WS:
+            if out and out[-1][0] != WS:
+                out.append([WS, " "])
+        else:
+            out.append(tok)
+    if out and out[-1][0] == WS:
+        out.pop()
+    return out
+
+
+def normalize_tokens(text: str) -> list[list]:
+    s = unicodedata.normalize("NFKD", text).lower().strip()
+    toks = tokenize(s)
+    if "через" in s or "спустя" in s or "минус" in s or "−" in s:
+        toks = _drop_fillers_and_minus(toks)
+    if "мин" in s:
+        toks = _unify_unit(toks, _MIN_FORMS, "мин", "минут")
+    if "час" in s:
+        toks = _unify_unit(toks, _HOUR_FORMS, "час", "час")
+    if "мин" in s:
+        toks = _reorder(toks, "минут")
+    if "час" in s:
+        toks = _reorder(toks, "час")
+    return _collapse(toks)
+
+
+def normalize(text: str) -> str:
+    return "".join(tok[1] for tok in normalize_tokens(text))
+
+
+# ---- разбор ----
+def _signed_number(toks, i):
+    """
+    Значение числа-токена i так, как его видит \\b(-?\\d+): минус учитывается,
+    только если перед ним стоит буква/цифра ("2-3"), иначе берётся модуль ("-2" -> 2).
+    None — если число приклеено к слову слева ("x5").
+    """
+    if i >= 1 and toks[i - 1][1] == "-":
+        if i >= 2 and _is_w(toks[i - 2]):
+            return "-" + toks[i][1]
+        return toks[i][1]
+    if _boundary_before(toks, i):
+        return toks[i][1]
+    return None
+
+
+def _unit_after(toks, i):
+    """Единица сразу после токена i (через необязательный пробел): 'h', 'm' или None."""
+    j = i + 1
+    n = len(toks)
+    if j < n and toks[j][0] == WS:
+        j += 1
+    if j >= n or toks[j][0] != WORD or not _boundary_after(toks, j):
+        return None
+    text = toks[j][1]
+    if text == "час":
+        return "h"
+    if text in _MINUTE_UNITS:
+        return "m"
+    return None
+
+
+def word_to_int(words: str) -> int | None:
+    total = 0
+    for word in words.split():
+        v = RU_NUM.get(word)
+        if v is None:
+            return None
+        total += v
+    return total if total > 0 else None
+
+
+def _parse_words_with_unit(t: str) -> int | None:
+    m = _NEG_WORDS_RE.search(t)
+    if m:
+        val = word_to_int(m.group(1).strip())
+        return -val if val is not None else None
+
+    m = _WORDS_RE.search(t)
+    if not m:
+        return None
+    return word_to_int(m.group(1).strip())
+
+
+def _parse(text: str) -> int | None:
+    toks = normalize_tokens(text)
+    n = len(toks)
+
+    # один проход: первые совпадения всех числовых форм
+    hours = minutes = decimal = number_unit = None
+    half = hour_and_half = False
+    for i in range(n):
+        kind, tok_text = toks[i]
+        if kind == NUM:
+            value = _signed_number(toks, i)
+            if value is None:
+                continue
+            unit = _unit_after(toks, i)
+            if unit == "h":
+                if hours is None:
+                    hours = int(value)
+                if number_unit is None:
+                    number_unit = int(value) * 60
+            elif unit == "m":
+                if minutes is None:
+                    minutes = int(value)
+                if number_unit is None:
+                    number_unit = int(value)
+            # "1,5 час"
+            if (
+                decimal is None and i + 2 < n
+                and toks[i + 1][1] in (".", ",") and toks[i + 2][0] == NUM
+                and _unit_after(toks, i + 2) == "h"
+            ):
+                decimal = int(round(float(value + "." + toks[i + 2][1]) * 60))
+        elif kind == WORD and _boundary_before(toks, i):
+            if tok_text == _HALF_HOUR and _boundary_after(toks, i):
+                half = True
+            elif tok_text in _HOUR_AND_HALF and _boundary_after(toks, i):
+                hour_and_half = True
+            elif tok_text == "полтора":
+                j = i + 1
+                if j < n and toks[j][0] == WS:
+                    j += 1
+                if j < n and toks[j][0] == WORD and toks[j][1] in _HOUR_FORMS and _boundary_after(toks, j):
+                    hour_and_half = True
+
+    # порядок и «falsy -> дальше» как в старой цепочке parse_*()
+    # 1) "2 часа 30 минут"
+    if hours is not None and minutes is not None:
+        combo = hours * 60 + minutes
+        if combo:
+            return combo
+    # 2) "1,5 часа"
+    if decimal:
+        return decimal
+    # 3) "полчаса", "полтора часа"
+    if half:
+        return 30
+    if hour_and_half:
+        return 90
+    # 4) "5 минут", "-2 часа"
+    if number_unit:
+        return number_unit
+
+    t = "".join(tok[1] for tok in toks)
+    # 5) "двадцать минут", "- пять минут"
+    if "минут" in t:
+        value = _parse_words_with_unit(t)
+        if value:
+            return value
+    # 6) Просто число
+    if t.startswith("-") and t[1:].isdigit():
+        return -int(t[1:]) or None
+    if t.isdigit():
+        return int(t) or None
+    return None
+
+
+@lru_cache(maxsize=4096)
+def parse_to_minutes(text: str) -> int | None:
+    """Минуты из текста или None, если разобрать не удалось. Повторы берутся из кэша."""
+    return _parse(text)
+
+
+def parse_many(texts: Iterable[str]) -> list[int | None]:
+    """Разбор пачки строк (например, при импорте задач); одинаковые строки считаются один раз."""
+    return [parse_to_minutes(t) for t in texts]
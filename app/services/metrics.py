@@ -0,0 +1,176 @@
+# app/services/metrics.py
+"""
+Метрики процесса в текстовом формате Prometheus и HTTP-эндпоинт /metrics на aiohttp.
+
+Своя маленькая реализация вместо prometheus_client: нужны только счётчики, gauge и гистограммы.
+Обновляются из event loop (тик планировщика, воркеры отправки), поэтому без блокировок.
+"""
+import math
+
+from aiohttp import web
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry: list = []
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        if not self.labelnames and not self._values:
+            lines.append(f"{self.name} 0")
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_fmt(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = float(value)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self._counts[i] += 1
+                break
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        cumulative = 0
+        for bound, count in zip(self.buckets, self._counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_fmt(bound)}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {_fmt(self.sum)}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---- метрики планировщика и отправки ----
+_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_LAG_SECONDS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+tick_duration = Histogram(
+    "scheduler_tick_duration_seconds", "Длительность тика планировщика (выборка due + постановка в очередь).", _SECONDS
+)
+tick_rows = Histogram(
+    "scheduler_tick_rows", "Сколько due-строк пришло из БД за тик.", (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+tick_errors = Counter("scheduler_tick_errors_total", "Тики, упавшие с исключением.")
+due_backlog = Gauge(
+    "scheduler_due_backlog", "Наступившие, но ещё не отправленные задачи (по последнему тику)."
+)
+oldest_due_lag = Gauge(
+    "scheduler_oldest_due_lag_seconds", "Насколько просрочена самая старая due-задача на последнем тике."
+)
+
+delivery_lag = Histogram(
+    "reminder_delivery_lag_seconds", "now - срок задачи в момент отправки напоминания.", _LAG_SECONDS
+)
+send_latency = Histogram("reminder_send_latency_seconds", "Длительность вызова sendMessage.", _SECONDS)
+sent_total = Counter("reminders_sent_total", "Успешно отправленные напоминания.")
+send_failures = Counter(
+    "reminder_send_failures_total", "Неудачные отправки по типу исключения.", ("type",)
+)
+send_retries = Counter("reminder_send_retries_total", "Сообщения outbox, отложенные на повтор.")
+send_dead = Counter("reminders_failed_total", "Сообщения outbox, ушедшие в failed (повторять бессмысленно).")
+flood_wait = Counter(
+    "telegram_retry_after_seconds_total", "Сколько секунд отправка стояла по retry_after от Telegram."
+)
+quiet_deferred = Counter("reminders_quiet_deferred_total", "Наступившие задачи, отложенные до конца тихих часов.")
+
+# ---- архиватор ----
+archived_total = Counter("tasks_archived_total", "Закрытые задачи, перенесённые в tasks_archive.")
+vacuum_reclaimed = Counter("db_vacuum_reclaimed_bytes_total", "Байт, возвращённых файлу базы incremental vacuum.")
+
+
+# ---- HTTP ----
+async def _handle(request: web.Request) -> web.Response:
+    return web.Response(body=render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def start_server(host: str = "127.0.0.1", port: int = 9108) -> web.AppRunner:
+    """
+    Поднимает GET /metrics в текущем event loop; остановка — await runner.cleanup().
+    Порт занят — OSError (runner при этом уже закрыт).
+    """
+    app = web.Application()
+    app.router.add_get("/metrics", _handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except BaseException:
+        await runner.cleanup()
+        raise
+    return runner
@@ -0,0 +1,92 @@
+# app/services/quiet_hours.py
+"""
+Часовые пояса пользователей и тихие часы.
+
+Окно задаётся в минутах от локальной полуночи (users.quiet_start / quiet_end), [start, end);
+start > end — окно через полночь. Планировщик раз в тик считает, у каких (timezone, окно) тихие часы
+идут прямо сейчас и когда кончаются (active_windows), и repo.defer_quiet одним UPDATE
+откладывает наступившие задачи таких пользователей до конца окна.
+"""
+import logging
+import re
+from datetime import datetime, timedelta, tzinfo
+from functools import lru_cache
+from typing import Iterable, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+log = logging.getLogger(__name__)
+
+# то же значение, что DEFAULT у users.timezone
+DEFAULT_TZ = "Europe/Warsaw"
+DAY_MINUTES = 24 * 60
+
+_WINDOW_RE = re.compile(r"^\s*(\d{1,2})(?::(\d{2}))?\s*[-–—]\s*(\d{1,2})(?::(\d{2}))?\s*$")
+
+
+@lru_cache(maxsize=512)
+def _zone(name: str) -> tzinfo:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        log.warning("unknown timezone %r, using %s", name, DEFAULT_TZ)
+        return ZoneInfo(DEFAULT_TZ)
+
+
+def zone(name: Optional[str]) -> tzinfo:
+    """ZoneInfo по имени из users.timezone (кэшируется); неизвестное имя — DEFAULT_TZ."""
+    return _zone(name or DEFAULT_TZ)
+
+
+def is_valid_tz(name: str) -> bool:
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+
+# ---- окна ----
+def parse_window(text: str) -> Optional[tuple[int, int]]:
+    """'23:00-08:00' / '23-8' -> (1380, 480); None, если не разобрать или начало = концу."""
+    m = _WINDOW_RE.match(text)
+    if not m:
+        return None
+    sh, sm, eh, em = (int(g) if g else 0 for g in m.groups())
+    if sh > 23 or eh > 24 or sm > 59 or em > 59 or (eh == 24 and em):
+        return None
+    start, end = sh * 60 + sm, (eh * 60 + em) % DAY_MINUTES
+    if start == end:
+        return None
+    return start, end
+
+
+def format_window(start: int, end: int) -> str:
+    return f"{start // 60:02d}:{start % 60:02d}–{end // 60:02d}:{end % 60:02d}"
+
+
+def window_end(now_ts: float, tz_name: Optional[str], start: int, end: int) -> Optional[float]:
+    """Если в now_ts у пользователя тихие часы — когда они кончатся (unix ts); иначе None."""
+    local = datetime.fromtimestamp(now_ts, zone(tz_name))
+    minute = local.hour * 60 + local.minute
+    if start < end:
+        inside = start <= minute < end
+        days = 0
+    else:
+        inside = minute >= start or minute < end
+        days = 1 if minute >= start else 0
+    if not inside:
+        return None
+    end_date = local.date() + timedelta(days=days)
+    until = datetime(end_date.year, end_date.month, end_date.day, end // 60, end % 60, tzinfo=local.tzinfo)
+    return until.timestamp()
+
+
+def active_windows(now_ts: float, settings: Iterable) -> list[tuple]:
+    """(timezone, quiet_start, quiet_end, until) для окон из settings, которые идут в now_ts."""
+    out = []
+    for tz_name, start, end in settings:
+        until = window_end(now_ts, tz_name, start, end)
+        if until is not None and until > now_ts:
+            out.append((tz_name, start, end, until))
+    return out
+
@@ -0,0 +1,96 @@
+# app/services/render_cache.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from app.db import repo
+
+
+class DataVersions:
+    """
+    Версия данных пользователя: растёт при любой записи, затрагивающей его задачи или профиль.
+    Бампается слушателями repo (в т.ч. из потоков БД), поэтому под блокировкой.
+    """
+
+    def __init__(self):
+        self._versions: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> int:
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: int) -> None:
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    # сигнатуры слушателей repo
+    def on_task_change(self, task_id, user_id, due_at) -> None:
+        self.bump(user_id)
+
+    def on_user_change(self, user_id) -> None:
+        self.bump(user_id)
+
+
+class RenderCache:
+    """
+    LRU готовых страниц /list: (user_id, view_key) -> (версия данных, text, keyboard).
+    Запись с устаревшей версией считается промахом. TTL страхует от записей
+    из другого процесса, о которых слушатели этого процесса не узнают.
+    """
+
+    def __init__(self, versions: DataVersions, maxsize: int = 5_000, ttl: float = 300.0):
+        self.versions = versions
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: OrderedDict = OrderedDict()
+
+    def get(self, user_id: int, view_key):
+        key = (user_id, view_key)
+        item = self._items.get(key)
+        if item is None:
+            return None
+        version, expires_at, view = item
+        if version != self.versions.get(user_id) or expires_at <= time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return view
+
+    def put(self, user_id: int, view_key, version: int, view) -> None:
+        key = (user_id, view_key)
+        self._items[key] = (version, time.monotonic() + self.ttl, view)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+
+class MessageHashes:
+    """Хэш последнего содержимого сообщения с клавиатурой — чтобы не слать edit без изменений."""
+
+    def __init__(self, maxsize: int = 20_000):
+        self.maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def digest(text: str, keyboard) -> str:
+        payload = text + "\0" + (keyboard.model_dump_json() if keyboard is not None else "")
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+    def is_same(self, chat_id: int, message_id: int, digest: str) -> bool:
+        return self._items.get((chat_id, message_id)) == digest
+
+    def remember(self, chat_id: int, message_id: int, digest: str) -> None:
+        key = (chat_id, message_id)
+        self._items[key] = digest
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+
+data_versions = DataVersions()
+repo.add_listener(data_versions.on_task_change)
+repo.add_user_listener(data_versions.on_user_change)
+
+list_views = RenderCache(data_versions)
+message_hashes = MessageHashes()
@@ -3,50 +3,220 @@ import asyncio
 import time
 from typing import Optional
 from aiogram import Bot
-from app.db import repo
-from .tasks import deliver_reminder
-from app.db.repo import is_user_sleeping
+from app.db import async_repo, repo
+from . import metrics
+from .delivery import CATCHUP_SKIP, CATCHUP_SUMMARY, DeliveryPipeline, GLOBAL_RATE, LEASE_SECONDS
+from .due_heap import DueHeap
+from .quiet_hours import active_windows
 
+# Лок — от наложения тиков внутри процесса; между процессами от дублей защищает захват строк (claim_due)
 _TICK_LOCK = asyncio.Lock()
 
-async def _process_tick(bot: Bot, batch_limit: int = 50) -> int:
+async def _process_tick(pipeline: DeliveryPipeline, batch_limit: int = 50) -> tuple[bool, int]:
     """
-    Обрабатывает одну «тик»-итерацию: достаёт due-задачи и отправляет напоминания.
-    Возвращает количество обработанных задач.
+    Обрабатывает одну «тик»-итерацию: захватывает due-задачи и ставит напоминания в очередь отправки
+    (через outbox, задачи при этом сразу переносятся на следующий срок).
+    Саму отправку и повторы делают воркеры pipeline, тик их не ждёт.
+    Строки, захваченные другими процессами, в выборку не попадают; спящих claim_due уже отсеял,
+    задачи пользователей в тихих часах перед выборкой откладываются до конца окна (defer_quiet).
+    Возвращает (пришёл ли батч из БД полным, сколько строк поставлено в очередь).
     """
     now = time.time()
-    due_rows = repo.get_due(now, batch_limit, user_id=None)
-    sent = 0
-    for row in due_rows:
-        ok = await deliver_reminder(bot, row)
-        if ok:
-            sent += 1
-    return sent
+    # тихие часы: наступившее у таких пользователей уезжает до конца окна ещё до выборки
+    windows = active_windows(now, await async_repo.quiet_hours_settings())
+    if windows:
+        metrics.quiet_deferred.inc(await async_repo.defer_quiet(now, windows))
+    due_rows = await async_repo.claim_due(pipeline.owner, now, batch_limit, pipeline.lease_seconds)
+    full = len(due_rows) >= batch_limit
 
-async def deliver_reminder(bot: Bot, task_row) -> bool:
-    user_id = task_row["user_id"]
-    # если пользователь спит — пропускаем
-    if is_user_sleeping(user_id):
-        return False
+    metrics.tick_rows.observe(len(due_rows))
+    metrics.oldest_due_lag.set(
+        now - min(max(r["next_reminder_at"], r["paused_until"] or 0) for r in due_rows) if due_rows else 0
+    )
+    if not full:
+        # неполный батч — это и есть весь бэклог; при полном его досчитывает _drain (count_due)
+        metrics.due_backlog.set(len(due_rows))
 
-async def run(bot: Bot, interval_seconds: int = 15, batch_limit: int = 50, quiet: bool = True):
+    queued = await pipeline.submit(due_rows)
+    return full, queued
+
+async def _tick_logged(pipeline: DeliveryPipeline, batch_limit: int, quiet: bool) -> tuple[bool, int]:
+    try:
+        async with _TICK_LOCK:
+            started = time.monotonic()
+            full, processed = await _process_tick(pipeline, batch_limit=batch_limit)
+            metrics.tick_duration.observe(time.monotonic() - started)
+            if not quiet and processed:
+                print(f"[scheduler] queued={processed} sent={pipeline.sent} "
+                      f"failed={pipeline.failed} in_flight={pipeline.pending}")
+            return full, processed
+    except Exception as e:
+        # не уронить цикл из-за ошибки — просто логнём
+        metrics.tick_errors.inc()
+        if not quiet:
+            print(f"[scheduler] error: {e}")
+        return False, 0
+
+
+class _BatchSizer:
     """
-    Бесконечный цикл: раз в interval_seconds вызывает _process_tick.
-    Защищён от наложений через Lock (если тик занял дольше интервала).
+    Размер батча для адаптивного режима.
+    Цель — за один интервал тика поставить в очередь столько, сколько pipeline успеет отправить
+    при текущей задержке отправки, но не больше оставшегося бэклога.
     """
+
+    def __init__(self, batch_limit: int, horizon_seconds: float, min_batch: int = 10, max_batch: int = 1000):
+        self.size = batch_limit
+        self.horizon = horizon_seconds
+        self.min_batch = min(min_batch, batch_limit)
+        self.max_batch = max(max_batch, batch_limit)
+
+    def update(self, backlog: int, send_rate: float) -> int:
+        target = min(backlog, send_rate * self.horizon)
+        # сглаживаем, чтобы одна медленная отправка не обрушила батч
+        size = int(0.5 * self.size + 0.5 * target)
+        self.size = max(self.min_batch, min(self.max_batch, size))
+        return self.size
+
+
+class _DrainReport:
+    """Скорость разгребания бэклога (отправок/сек) и текущий бэклог — для логов."""
+
+    def __init__(self, pipeline: DeliveryPipeline, every_seconds: float = 30.0):
+        self.pipeline = pipeline
+        self.every = every_seconds
+        self.backlog = 0
+        self.drain_rate = 0.0
+        self._last_at = time.monotonic()
+        self._last_sent = pipeline.sent
+
+    def maybe_print(self, batch: int, quiet: bool) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_at
+        if elapsed < self.every:
+            return
+        self.drain_rate = (self.pipeline.sent - self._last_sent) / elapsed
+        self._last_at, self._last_sent = now, self.pipeline.sent
+        if not quiet and (self.backlog or self.drain_rate):
+            print(f"[scheduler] backlog={self.backlog} drain={self.drain_rate:.1f}/s batch={batch}")
+
+
+async def _drain(pipeline: DeliveryPipeline, sizer: _BatchSizer, report: _DrainReport, quiet: bool) -> None:
+    """Тики подряд, пока батч возвращается полным; заодно подстраивает размер батча."""
+    while True:
+        full, queued = await _tick_logged(pipeline, sizer.size, quiet)
+        if not full:
+            report.backlog = 0
+            break
+        report.backlog = await async_repo.count_due(time.time())
+        metrics.due_backlog.set(report.backlog)
+        sizer.update(report.backlog, pipeline.max_rate)
+        report.maybe_print(sizer.size, quiet)
+        if queued == 0:
+            # всё наступившее уже в очереди отправки — ждём следующего тика
+            break
+    report.maybe_print(sizer.size, quiet)
+
+async def _run_poll(pipeline: DeliveryPipeline, interval_seconds: int, batch_limit: int, quiet: bool, adaptive: bool):
+    sizer = _BatchSizer(batch_limit, horizon_seconds=interval_seconds)
+    report = _DrainReport(pipeline)
     while True:
         started = time.time()
-        try:
-            async with _TICK_LOCK:
-                processed = await _process_tick(bot, batch_limit=batch_limit)
-                if not quiet and processed:
-                    print(f"[scheduler] sent={processed}")
-        except Exception as e:
-            # не уронить цикл из-за ошибки — просто логнём
-            if not quiet:
-                print(f"[scheduler] error: {e}")
+        if adaptive:
+            await _drain(pipeline, sizer, report, quiet)
+        else:
+            await _tick_logged(pipeline, batch_limit, quiet)
 
         # выдерживаем периодичность
         elapsed = time.time() - started
         sleep_for = max(0.0, interval_seconds - elapsed)
         await asyncio.sleep(sleep_for)
+
+async def _run_heap(pipeline: DeliveryPipeline, batch_limit: int, quiet: bool, resync_seconds: int, adaptive: bool):
+    """
+    Событийный режим: спим ровно до ближайшего срока из in-memory кучи.
+    В БД ходим только когда что-то действительно наступило.
+    Раз в resync_seconds куча перечитывается целиком — это подбирает задачи,
+    которые не ушли (ошибка отправки) или менялись другим процессом.
+    """
+    heap = DueHeap()
+    heap.bind(asyncio.get_running_loop())
+    repo.add_listener(heap.push)
+    # тики здесь по событию, поэтому батч считаем на несколько секунд отправки вперёд
+    sizer = _BatchSizer(batch_limit, horizon_seconds=5.0)
+    report = _DrainReport(pipeline)
+    try:
+        synced_at = 0.0
+        while True:
+            now = time.time()
+            if now - synced_at >= resync_seconds:
+                heap.load(await async_repo.load_schedule())
+                synced_at = now
+
+            heap.clear_wakeup()
+            earliest = heap.peek()
+            if earliest is None or earliest > now:
+                until_resync = synced_at + resync_seconds - now
+                timeout = until_resync if earliest is None else min(earliest - now, until_resync)
+                await heap.wait(max(0.0, timeout))
+                continue
+
+            heap.pop_due(now)
+            # добираем всё наступившее, пока батчи приходят полными
+            if adaptive:
+                await _drain(pipeline, sizer, report, quiet)
+            else:
+                while True:
+                    full, queued = await _tick_logged(pipeline, batch_limit, quiet)
+                    if not full or queued == 0:
+                        break
+    finally:
+        repo.remove_listener(heap.push)
+
+async def run(
+    bot: Bot,
+    interval_seconds: int = 15,
+    batch_limit: int = 50,
+    quiet: bool = True,
+    concurrency: int = 8,
+    global_rate: float = GLOBAL_RATE,
+    mode: str = "poll",
+    resync_seconds: int = 300,
+    adaptive: bool = False,
+    worker_id: Optional[str] = None,
+    lease_seconds: float = LEASE_SECONDS,
+    catch_up: str = CATCHUP_SUMMARY,
+):
+    """
+    Бесконечный цикл планировщика.
+    mode="poll": раз в interval_seconds вызывает _process_tick.
+    mode="heap": спит до ближайшего срока по in-memory расписанию (см. _run_heap).
+    adaptive=True: если батч пришёл полным, сразу берём следующий, а размер батча
+    подстраивается под задержку отправки и оставшийся бэклог (batch_limit — стартовое значение).
+    Тики защищены от наложений через Lock (если тик занял дольше интервала).
+    Отправка идёт параллельно (до concurrency сообщений) с учётом лимитов Telegram.
+    Можно запускать несколько процессов на одной базе: строки захватываются на worker_id
+    (по умолчанию хост:pid:случайный хвост) на lease_seconds, захват упавшего процесса истекает
+    и строки забирают остальные.
+    catch_up — что делать со сроками, пропущенными за время простоя (см. CATCHUP_* в delivery.py);
+    при "skip" перед первым тиком все такие задачи одним проходом по БД переносятся на ближайший срок.
+    """
+    if mode not in ("poll", "heap"):
+        raise ValueError(f"unknown scheduler mode: {mode}")
+
+    pipeline = DeliveryPipeline(
+        bot, concurrency=concurrency, global_rate=global_rate, owner=worker_id, lease_seconds=lease_seconds,
+        catch_up=catch_up,
+    )
+    if catch_up == CATCHUP_SKIP:
+        moved = await async_repo.skip_missed(time.time())
+        if not quiet and moved:
+            print(f"[scheduler] catch-up: skipped missed reminders of {moved} tasks")
+    pipeline.start()
+    try:
+        if mode == "heap":
+            await _run_heap(pipeline, batch_limit, quiet, resync_seconds, adaptive)
+        else:
+            await _run_poll(pipeline, interval_seconds, batch_limit, quiet, adaptive)
+    finally:
+        await pipeline.stop()
@@ -0,0 +1,68 @@
+# app/services/task_import.py
+"""
+Разбор списка задач для /import (app/handlers/import_tasks.py).
+
+Одна задача — одна строка: `название | заметка | интервал`, например `Полить цветы | на балконе | 2 часа`.
+Заметку можно не писать (`название | интервал`) или поставить "-", как в /add.
+Пустые строки и строки с # в начале пропускаются. Все интервалы разбираются одной пачкой (parse_many).
+"""
+from typing import NamedTuple
+
+from .duration import parse_many
+
+# Больше строк за раз не берём: один импорт — одна транзакция записи, и сводка должна влезть в сообщение
+MAX_LINES = 500
+MAX_NAME_LEN = 256
+
+
+class LineError(NamedTuple):
+    line_no: int
+    text: str
+    reason: str
+
+
+class ImportResult(NamedTuple):
+    items: list[tuple[str, str | None, int]]  # (название, заметка, минуты) — как в repo.add_tasks
+    errors: list[LineError]
+    skipped: int  # строки сверх MAX_LINES
+
+
+def parse_lines(text: str) -> ImportResult:
+    candidates = []  # (номер строки, строка, название, заметка, интервал-текст)
+    errors: list[LineError] = []
+    skipped = 0
+    for line_no, raw in enumerate(text.splitlines(), start=1):
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        if len(candidates) + len(errors) >= MAX_LINES:
+            skipped += 1
+            continue
+
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 2:
+            name, note, interval = parts[0], None, parts[1]
+        elif len(parts) == 3:
+            name, note, interval = parts
+        else:
+            errors.append(LineError(line_no, line, "нужно «название | заметка | интервал»"))
+            continue
+
+        if not name:
+            errors.append(LineError(line_no, line, "пустое название"))
+        elif len(name) > MAX_NAME_LEN:
+            errors.append(LineError(line_no, line, f"название длиннее {MAX_NAME_LEN} символов"))
+        else:
+            candidates.append((line_no, line, name, None if note in (None, "", "-") else note, interval))
+
+    items = []
+    for (line_no, line, name, note, interval), minutes in zip(candidates, parse_many(c[4] for c in candidates)):
+        if minutes is None:
+            errors.append(LineError(line_no, line, f"не понял интервал «{interval}»"))
+        elif minutes <= 0:
+            errors.append(LineError(line_no, line, "интервал должен быть больше нуля"))
+        else:
+            items.append((name, note, minutes))
+
+    errors.sort(key=lambda e: e.line_no)
+    return ImportResult(items, errors, skipped)
@@ -1,35 +1,60 @@
 # app/services/tasks.py
 import time
+
 from aiogram import Bot
-from app.db import repo
 
-async def deliver_reminder(bot: Bot, task_row) -> bool:
+from . import metrics
+
+
+def reminder_text(task_row, missed: int = 0) -> str:
     """
-    Отправляет напоминание по одной задаче и сдвигает её next_reminder_at на следующий интервал.
-    Возвращает True, если всё прошло хорошо.
+    Текст напоминания по строке задачи (repo.claim_due).
+    missed — сколько сроков пропущено до этого (политика catch-up «summary»): одна строка вместо шквала.
     """
-    user_id = task_row["user_id"]
-    task_id = task_row["id"]
     name = task_row["task_name"]
     note = task_row["task_note"] or ""
-    interval = int(task_row["interval"])
-
-    # 1) Кому слать
-    user = repo.get_user_by_id(user_id)
-    if not user:
-        return False
-    chat_id = user["telegram_user_id"]
-
-    # 2) Текст сообщения
     lines = [f"🔔 Напоминание: <b>{name}</b>"]
     if note:
         lines.append(note)
-    text = "\n".join(lines)
+    if missed > 0:
+        lines.append(f"<i>Пропущено напоминаний: {missed}</i>")
+    return "\n".join(lines)
 
-    # 3) Отправка
-    await bot.send_message(chat_id, text)
 
-    # 4) Перенос на следующий раз
-    next_ts = time.time() + interval * 60
-    repo.reschedule(task_id, user_id, next_ts)
+async def deliver_reminder(bot: Bot, message_row) -> bool:
+    """
+    Отправляет одно сообщение из outbox (chat_id, text, due_at уже в строке).
+    Ошибки не глушим: что с ними делать (повтор, backoff, failed), решает DeliveryPipeline.
+    Возвращает True, если всё прошло хорошо.
+    """
+    # метрики: насколько опоздали и сколько шёл запрос
+    started = time.time()
+    metrics.delivery_lag.observe(max(0.0, started - message_row["due_at"]))
+    try:
+        await bot.send_message(message_row["chat_id"], message_row["text"])
+    except Exception as e:
+        metrics.send_failures.inc(type=type(e).__name__)
+        raise
+    finally:
+        metrics.send_latency.observe(time.time() - started)
+    metrics.sent_total.inc()
     return True
+
+
+def next_reminder_ts(task_row, now: float) -> float:
+    """
+    Следующий срок по сетке задачи: next_reminder_at + k * interval, первый строго позже now.
+    Привязка к исходному расписанию, а не к моменту отправки — задержки не накапливаются.
+    То же, что repo._NEXT_SLOT в SQL.
+    """
+    # интервал < 1 минуты мог остаться в старых строках — считаем минутным, а не делим на ноль
+    period = max(1, int(task_row["interval"])) * 60
+    anchor = task_row["next_reminder_at"]
+    return anchor + (max(0, int((now - anchor) // period)) + 1) * period
+
+
+def missed_occurrences(task_row, now: float) -> int:
+    """Сколько сроков по сетке прошло целиком, кроме того, за которым отправляем сейчас."""
+    period = max(1, int(task_row["interval"])) * 60
+    due_at = max(task_row["next_reminder_at"], task_row["paused_until"] or 0)
+    return max(0, int((now - due_at) // period))
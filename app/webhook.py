@@ -0,0 +1,115 @@
+# app/webhook.py
+"""
+Webhook-режим: aiohttp-приложение принимает апдейты от Telegram (или от балансировщика)
+и отдаёт их диспетчеру. Отвечаем 200 сразу, обработка идёт в фоне,
+одновременно — не больше concurrency апдейтов. Апдейты одного пользователя обрабатываются
+строго по очереди (шаги FSM в /add не должны обгонять друг друга), разных — параллельно.
+"""
+import asyncio
+import hmac
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiogram.types.update import UpdateTypeLookupError
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookHandler:
+    def __init__(self, dp: Dispatcher, bot: Bot, concurrency: int = 32, secret: str | None = None):
+        if concurrency <= 0:
+            raise ValueError("concurrency must be > 0")
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        # последний апдейт каждого пользователя: следующий ждёт его завершения
+        self._tails: dict[int, asyncio.Task] = {}
+
+    def _authorized(self, request: web.Request) -> bool:
+        if not self.secret:
+            return True
+        return hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+            # тип апдейта, которого aiogram не знает, падает уже здесь, а не в диспетчере
+            event = update.event
+        except (ValueError, UpdateTypeLookupError):
+            # битый апдейт повторять бессмысленно — 200, чтобы Telegram не слал его снова
+            log.warning("malformed update skipped")
+            return web.Response()
+
+        user = getattr(event, "from_user", None)
+        key = user.id if user is not None else None
+        prev = self._tails.get(key) if key is not None else None
+        task = asyncio.create_task(self._process(update, prev))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if key is not None:
+            self._tails[key] = task
+            task.add_done_callback(lambda t, key=key: self._forget_tail(key, t))
+        return web.Response()
+
+    def _forget_tail(self, key: int, task: asyncio.Task) -> None:
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def _process(self, update: Update, prev: asyncio.Task | None) -> None:
+        if prev is not None:
+            # ждём предыдущий апдейт этого пользователя, не занимая слот
+            await asyncio.wait((prev,))
+        async with self._slots:
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                log.exception("update %s failed", update.update_id)
+
+    async def drain(self) -> None:
+        """Дождаться апдейтов, которые уже приняты (при остановке)."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    host: str = "0.0.0.0",
+    port: int = 8080,
+    path: str = "/webhook",
+    concurrency: int = 32,
+    secret: str | None = None,
+    public_url: str | None = None,
+) -> None:
+    """
+    Поднимает сервер и живёт, пока задачу не отменят.
+    public_url — внешний адрес (https://host/путь); если задан, вызывается setWebhook.
+    Без него вебхук регистрируется снаружи (балансировщик, деплой) или апдейты шлются руками
+    (bench/replay_updates.py).
+    """
+    handler = WebhookHandler(dp, bot, concurrency=concurrency, secret=secret)
+    app = web.Application()
+    app.router.add_post(path, handler.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    if public_url:
+        await bot.set_webhook(public_url, secret_token=secret, allowed_updates=dp.resolve_used_update_types())
+    # startup/shutdown-хендлеры диспетчера, как при polling
+    await dp.emit_startup(bot=bot)
+    log.info("webhook listening on %s:%s%s", host, port, path)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await handler.drain()
+        await dp.emit_shutdown(bot=bot)
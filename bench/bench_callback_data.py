@@ -0,0 +1,116 @@
+# bench/bench_callback_data.py
+"""
+Сверка и замер разбора callback_data кнопок /list: python -m bench.bench_callback_data
+
+1) кнопки, которые уже висят в чатах: исходный постраничный формат (как его строил старый
+   app/service.py) и формат с курсором — разбираются в ожидаемый ListAction, а не в None
+   («Кнопка устарела»); испорченные строки — в None;
+2) encode -> decode текущего формата возвращает то же самое;
+3) время разбора одной строки по форматам.
+"""
+import sys
+import time
+
+from app.services import callback_data as cbd
+from app.services.callback_data import ListAction
+
+# строка -> ожидаемый результат decode
+# исходный формат: номер страницы, курсора нет — первая страница
+PAGED_CASES = [
+    ("list_page|1|5", ListAction(cbd.PAGE, page=0, limit=5)),
+    ("list_page|0|5", ListAction(cbd.PAGE, page=0, limit=5)),
+    ("select_task|12|0|5", ListAction(cbd.SELECT, page=0, limit=5, task_id=12)),
+    ("select_task|12|3|5", ListAction(cbd.SELECT, page=0, limit=5, task_id=12)),
+    ("task_done|12|0|5", ListAction(cbd.DONE, page=0, limit=5, task_id=12)),
+    ("task_snooze|12|15|2|5", ListAction(cbd.SNOOZE, page=0, limit=5, task_id=12, minutes=15)),
+    ("task_snooze|12|60|0|5", ListAction(cbd.SNOOZE, page=0, limit=5, task_id=12, minutes=60)),
+    ("task_snooze|12|1440|1|5", ListAction(cbd.SNOOZE, page=0, limit=5, task_id=12, minutes=1440)),
+    ("task_delete|12|1|5", ListAction(cbd.DELETE, page=0, limit=5, task_id=12)),
+    ("back_to_list|4|5", ListAction(cbd.BACK, page=0, limit=5)),
+]
+CASES = PAGED_CASES + [
+    # формат с курсором
+    ("list_page|2|>1760000000.123456:122|5",
+     ListAction(cbd.PAGE, page=2, limit=5, cursor=(1760000000.123456, 122))),
+    ("list_page|1|<1760000000.5:7|5",
+     ListAction(cbd.PAGE, page=1, limit=5, cursor=(1760000000.5, 7), backward=True)),
+    ("task_snooze|123|60|0|-|5", ListAction(cbd.SNOOZE, page=0, limit=5, task_id=123, minutes=60)),
+    # испорченное и чужое
+    ("list_page|x|5", None),
+    ("list_page|-1|5", None),
+    ("list_page|0|500", None),
+    ("task_snooze|12|0|0|5", None),
+    ("task_done|12", None),
+    ("select_task|12|0|5|5|5", None),
+    ("1z", None),
+    # id и ts курсора вне диапазона SQLite
+    ("1d" + "z" * 20 + ".0.-.5", None),
+    ("task_done|99999999999999999999|0|5", None),
+    ("1p0.>" + "_" * 11 + "1.5", None),
+    ("list_page|1|>nan:7|5", None),
+    ("list_page|1|>1760000000.5:99999999999999999999|5", None),
+    ("", None),
+    ("something|else", None),
+]
+
+
+def roundtrip_cases() -> list[ListAction]:
+    cursor = (1760000000.123456, 122)
+    return [
+        ListAction(cbd.PAGE, page=3, limit=5, cursor=cursor),
+        ListAction(cbd.PAGE, page=1, limit=5, cursor=cursor, backward=True),
+        ListAction(cbd.SELECT, page=0, limit=5, cursor=cursor, task_id=12),
+        ListAction(cbd.DONE, page=2, limit=10, task_id=99999),
+        ListAction(cbd.SNOOZE, page=7, limit=5, cursor=cursor, task_id=123, minutes=1440),
+        ListAction(cbd.DELETE, page=0, limit=50, cursor=cursor, task_id=1),
+        ListAction(cbd.BACK, page=4, limit=5, cursor=cursor),
+    ]
+
+
+def check() -> list[str]:
+    errors = []
+    for data, expected in CASES:
+        got = cbd.decode(data)
+        if got != expected:
+            errors.append(f"{data!r}: expected={expected} got={got}")
+    for act in roundtrip_cases():
+        data = cbd.encode(act.action, act.page, act.limit, act.cursor, act.backward, act.task_id, act.minutes)
+        got = cbd.decode(data)
+        if got != act or len(data.encode()) > 64:
+            errors.append(f"{act}: {data!r} ({len(data.encode())} bytes) -> {got}")
+    for bad in ({"task_id": cbd.MAX_ID + 1}, {"cursor": (float("inf"), 1)}, {"cursor": (1.0, -1)}):
+        try:
+            data = cbd.encode(cbd.DONE, task_id=bad.get("task_id", 1), cursor=bad.get("cursor"))
+        except ValueError:
+            continue
+        errors.append(f"encode({bad}) did not raise: {data!r}")
+    return errors
+
+
+def per_call_us(texts, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            cbd.decode(text)
+    return (time.perf_counter() - started) / (rounds * len(texts)) * 1e6
+
+
+def main(rounds: int = 2000) -> int:
+    errors = check()
+    if errors:
+        print("MISMATCH:")
+        for e in errors:
+            print("  " + e)
+        return 1
+    print(f"cases: {len(CASES)} strings + {len(roundtrip_cases())} round trips, all ok")
+
+    current = [cbd.encode(a.action, a.page, a.limit, a.cursor, a.backward, a.task_id, a.minutes)
+               for a in roundtrip_cases()]
+    paged = [data for data, _ in PAGED_CASES]
+    print(f"v1              {per_call_us(current, rounds):8.2f} us/string")
+    print(f"page-based      {per_call_us(paged, rounds):8.2f} us/string")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# bench/bench_duration.py
+"""
+Сверка и замер разбора длительности: python -m bench.bench_duration
+
+1) каждая фраза корпуса (bench/duration_corpus.tsv) даёт тот же результат, что и в таблице,
+   и совпадает со старым разбором (bench/legacy_duration.py);
+2) время на фразу: старый разбор, новый без кэша (холодный) и с кэшем (повторные строки),
+   плюс parse_many на пачке.
+"""
+import sys
+import time
+from pathlib import Path
+
+from app.services import duration
+from bench import legacy_duration
+
+CORPUS = Path(__file__).with_name("duration_corpus.tsv")
+
+
+def load_corpus(path: Path = CORPUS) -> list[tuple[str, int | None]]:
+    cases = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line or line.startswith("#"):
+            continue
+        text, expected = line.rsplit("\t", 1)
+        cases.append((text, None if expected == "None" else int(expected)))
+    return cases
+
+
+def check(cases) -> list[str]:
+    errors = []
+    for text, expected in cases:
+        legacy = legacy_duration.parse_to_minutes(text)
+        got = duration.parse_to_minutes(text)
+        if not (got == expected == legacy):
+            errors.append(f"{text!r}: corpus={expected} legacy={legacy} new={got}")
+    return errors
+
+
+def per_call_us(fn, texts, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            fn(text)
+    return (time.perf_counter() - started) / (rounds * len(texts)) * 1e6
+
+
+def main(rounds: int = 200) -> int:
+    cases = load_corpus()
+    errors = check(cases)
+    if errors:
+        print("MISMATCH:")
+        for e in errors:
+            print("  " + e)
+        return 1
+    print(f"corpus: {len(cases)} phrases, all equal to legacy")
+
+    texts = [text for text, _ in cases]
+    legacy = per_call_us(legacy_duration.parse_to_minutes, texts, rounds)
+    cold = per_call_us(duration._parse, texts, rounds)
+    duration.parse_to_minutes.cache_clear()
+    warm = per_call_us(duration.parse_to_minutes, texts, rounds)
+
+    bulk = texts * 100
+    duration.parse_to_minutes.cache_clear()
+    started = time.perf_counter()
+    duration.parse_many(bulk)
+    bulk_us = (time.perf_counter() - started) / len(bulk) * 1e6
+
+    print(f"legacy          {legacy:8.2f} us/phrase")
+    print(f"new, no cache   {cold:8.2f} us/phrase  (x{legacy / cold:.1f})")
+    print(f"new, cached     {warm:8.2f} us/phrase  (x{legacy / warm:.1f})")
+    print(f"parse_many      {bulk_us:8.2f} us/phrase  ({len(bulk)} lines)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
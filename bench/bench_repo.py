@@ -0,0 +1,313 @@
+# bench/bench_repo.py
+"""
+Замер горячих путей repo и тика планировщика на синтетической базе:
+
+    python -m bench.bench_repo --users 100000 --tasks 5000000 --out before.json
+    python -m bench.bench_repo --users 100000 --tasks 5000000 --compare before.json
+
+База-шаблон генерируется один раз (bench/.data/, см. bench/dataset.py), каждый прогон работает
+на её копии со сроками, сдвинутыми на текущее время. Тик гоняется против FakeBot — без сети.
+Результат — JSON (p50/p99/среднее в мс и операций в секунду на каждый вызов), чтобы сравнивать коммиты.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from app.db import repo
+from app.services.delivery import DeliveryPipeline
+from app.services.scheduler import _process_tick
+from bench import dataset
+
+
+class FakeBot:
+    """Минимальная замена aiogram.Bot для DeliveryPipeline: «отправка» — только задержка."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+        return True
+
+
+def summarize(samples: list[float]) -> dict:
+    """samples — длительности в секундах."""
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def pct(q: float) -> float:
+        return ordered[min(n - 1, int(round(q * (n - 1))))] * 1000
+
+    total = sum(ordered)
+    return {
+        "n": n,
+        "p50_ms": round(pct(0.50), 4),
+        "p99_ms": round(pct(0.99), 4),
+        "mean_ms": round(total / n * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+        "ops_per_sec": round(n / total, 1) if total else None,
+    }
+
+
+def timed(fn, args_iter, samples: int) -> dict:
+    durations = []
+    for _ in range(samples):
+        args = next(args_iter)
+        started = time.perf_counter()
+        fn(*args)
+        durations.append(time.perf_counter() - started)
+    return summarize(durations)
+
+
+def _pick(db_path: Path, rng: random.Random):
+    """Случайные пользователи/задачи для вызовов и самый «тяжёлый» пользователь."""
+    conn = sqlite3.connect(db_path)
+    (users,) = conn.execute("SELECT MAX(id) FROM users").fetchone()
+    heavy, heavy_open = conn.execute("""
+        SELECT user_id, COUNT(*) AS c FROM tasks WHERE status = 1
+        GROUP BY user_id ORDER BY c DESC LIMIT 1
+    """).fetchone()
+    (max_task,) = conn.execute("SELECT MAX(id) FROM tasks").fetchone()
+    task_ids = [rng.randint(1, max_task) for _ in range(2000)]
+    owners = dict(conn.execute(
+        f"SELECT id, user_id FROM tasks WHERE id IN ({','.join('?' * len(task_ids))})", task_ids
+    ).fetchall())
+    conn.close()
+    tasks = [(tid, owners[tid]) for tid in task_ids if tid in owners]
+    return users, heavy, heavy_open, tasks
+
+
+def _cycle(make):
+    while True:
+        yield make()
+
+
+def _claim_and_release(now, limit):
+    # захват сразу отпускаем, иначе следующий вызов получил бы уже другие строки
+    rows = repo.claim_due("bench", now, limit, 60)
+    repo.release_leases("bench", [r["id"] for r in rows])
+
+
+def bench_repo_calls(db_path: Path, samples: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    users, heavy, heavy_open, tasks = _pick(db_path, rng)
+    now = time.time()
+
+    def some_user():
+        return rng.randint(1, users)
+
+    results = {}
+    results["get_due"] = timed(repo.get_due, _cycle(lambda: (now, 50)), samples)
+    results["claim_due+release"] = timed(_claim_and_release, _cycle(lambda: (now, 50)), samples)
+    results["count_due"] = timed(repo.count_due, _cycle(lambda: (now,)), max(1, samples // 10))
+    results["count_open"] = timed(repo.count_open, _cycle(lambda: (some_user(),)), samples)
+    results["list_open_paged"] = timed(repo.list_open_paged, _cycle(lambda: (some_user(), 0, 5)), samples)
+    results["list_open_paged_heavy_last"] = timed(
+        repo.list_open_paged, _cycle(lambda: (heavy, max(0, heavy_open - 5), 5)), samples
+    )
+    results["list_open_page"] = timed(repo.list_open_page, _cycle(lambda: (some_user(), None, 6)), samples)
+    results["snooze"] = timed(
+        repo.snooze, _cycle(lambda: (*rng.choice(tasks), rng.choice((5, 10, 30)))), samples
+    )
+    return results
+
+
+async def bench_ticks(ticks: int, batch_limit: int, concurrency: int, latency: float) -> dict:
+    """
+    tick — только _process_tick (выборка due + постановка в очередь),
+    tick_full — тик плюс ожидание отправки и переноса всего батча.
+    Лимиты Telegram сняты: меряем код, а не token bucket.
+    """
+    bot = FakeBot(latency)
+    pipeline = DeliveryPipeline(bot, concurrency=concurrency, global_rate=1e9, per_chat_rate=1e9)
+    pipeline.start()
+    tick, full = [], []
+    rows = 0
+    started_all = time.perf_counter()
+    try:
+        for _ in range(ticks):
+            started = time.perf_counter()
+            _, queued = await _process_tick(pipeline, batch_limit=batch_limit)
+            tick.append(time.perf_counter() - started)
+            await pipeline.join()
+            full.append(time.perf_counter() - started)
+            rows += queued
+    finally:
+        await pipeline.stop()
+    elapsed = time.perf_counter() - started_all
+
+    out = {"tick": summarize(tick), "tick_full": summarize(full)}
+    out["tick_full"]["rows"] = rows
+    out["tick_full"]["rows_per_sec"] = round(rows / elapsed, 1) if elapsed else None
+    return out
+
+
+def bench_skip_missed() -> dict:
+    """Стартовый проход catch-up «skip» по всей базе — один раз, он меняет данные (поэтому после тиков)."""
+    started = time.perf_counter()
+    moved = repo.skip_missed(time.time())
+    out = summarize([time.perf_counter() - started])
+    out["rows"] = moved
+    return out
+
+
+def bench_archive(batch_size: int = 500) -> dict:
+    """Архивация всех закрытых задач пачками (как services/archiver, без grace) + incremental vacuum."""
+    batches = []
+    moved = 0
+    while True:
+        started = time.perf_counter()
+        n = repo.archive_closed(time.time(), batch_size)
+        batches.append(time.perf_counter() - started)
+        moved += n
+        if n < batch_size:
+            break
+    started = time.perf_counter()
+    reclaimed = repo.incremental_vacuum()
+    out = summarize(batches)
+    out["rows"] = moved
+    out["vacuum_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    out["vacuum_reclaimed_bytes"] = reclaimed
+    return out
+
+
+def bench_sleepers(db_path: Path, sleepers: int, per_user: int, samples: int) -> dict:
+    """
+    Выборки due, когда у многих спящих пользователей накопились пропущенные задачи:
+    /sleep паркует их (repo.set_sleep_state), и claim_due/count_due/get_due не должны их перебирать.
+    Пользователи добавляются в базу прогона и остаются спать — поэтому в самом конце.
+    leaked — сколько задач спящих всё же вернул claim_due (должно быть 0).
+    """
+    now = time.time()
+    user_ids = [repo.get_or_create_user(900_000_000 + n, f"sleeper{n}")["id"] for n in range(sleepers)]
+    for uid in user_ids:
+        repo.add_tasks(uid, [(f"sleeper task {n}", None, 60) for n in range(per_user)])
+        repo.set_sleep_state(uid, True)
+    # сроки в прошлом — как будто пользователь проспал несколько часов
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"""
+        UPDATE tasks SET next_reminder_at = ? - 3600 * 3
+        WHERE user_id IN ({','.join('?' * len(user_ids))})
+    """, (now, *user_ids))
+    conn.commit()
+    conn.close()
+
+    sleeping = set(user_ids)
+    leaked = 0
+
+    def claim_and_count(now, limit):
+        nonlocal leaked
+        rows = repo.claim_due("bench", now, limit, 60)
+        leaked += sum(1 for r in rows if r["user_id"] in sleeping)
+        repo.release_leases("bench", [r["id"] for r in rows])
+
+    out = {
+        "sleepers_claim_due+release": timed(claim_and_count, _cycle(lambda: (now, 50)), samples),
+        "sleepers_count_due": timed(repo.count_due, _cycle(lambda: (now,)), max(1, samples // 10)),
+        "sleepers_get_due": timed(repo.get_due, _cycle(lambda: (now, 50)), samples),
+    }
+    out["sleepers_claim_due+release"]["leaked"] = leaked
+    out["sleepers_claim_due+release"]["parked_tasks"] = sleepers * per_user
+    return out
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict) -> str:
+    lines = [f"{'call':32} {'p50 ms':>26} {'p99 ms':>26}"]
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+
+        def cell(key):
+            ratio = cur[key] / base[key] if base[key] else float("inf")
+            return f"{base[key]:.3f}->{cur[key]:.3f} x{ratio:.2f}"
+
+        lines.append(f"{name:32} {cell('p50_ms'):>26} {cell('p99_ms'):>26}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--users", type=int, default=10_000)
+    p.add_argument("--tasks", type=int, default=500_000)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--db", type=Path, help="шаблонная база (по умолчанию bench/.data/bench_<users>u_<tasks>t.sqlite)")
+    p.add_argument("--fresh", action="store_true", help="перегенерировать шаблон")
+    p.add_argument("--samples", type=int, default=500, help="вызовов на каждую функцию repo")
+    p.add_argument("--ticks", type=int, default=50)
+    p.add_argument("--batch-limit", type=int, default=50)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--sleepers", type=int, default=500, help="спящих пользователей с пропущенными задачами")
+    p.add_argument("--sleeper-tasks", type=int, default=300, help="пропущенных задач у каждого спящего")
+    p.add_argument("--send-latency", type=float, default=0.0, help="задержка FakeBot.send_message, сек")
+    p.add_argument("--out", type=Path, help="куда записать JSON (иначе stdout)")
+    p.add_argument("--compare", type=Path, help="JSON прошлого прогона для сравнения")
+    args = p.parse_args(argv)
+
+    started = time.perf_counter()
+    template = dataset.ensure(args.users, args.tasks, path=args.db, seed=args.seed, fresh=args.fresh)
+    print(f"[bench] template {template} ready in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    work = dataset.working_copy(template)
+
+    repo.close_pool()
+    repo.DB_PATH = work
+    try:
+        results = bench_repo_calls(work, args.samples, args.seed)
+        results.update(asyncio.run(bench_ticks(args.ticks, args.batch_limit, args.concurrency, args.send_latency)))
+        results["skip_missed"] = bench_skip_missed()
+        results["archive_batch"] = bench_archive()
+        results.update(bench_sleepers(work, args.sleepers, args.sleeper_tasks, args.samples))
+    finally:
+        repo.close_pool()
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "users": args.users,
+            "tasks": args.tasks,
+            "seed": args.seed,
+            "samples": args.samples,
+            "ticks": args.ticks,
+            "batch_limit": args.batch_limit,
+            "concurrency": args.concurrency,
+            "send_latency": args.send_latency,
+            "sleepers": args.sleepers,
+            "sleeper_tasks": args.sleeper_tasks,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        args.out.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if args.compare:
+        print(compare(report, json.loads(args.compare.read_text(encoding="utf-8"))), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
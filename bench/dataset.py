@@ -0,0 +1,142 @@
+# bench/dataset.py
+"""
+Синтетическая база для бенчмарков: N пользователей, M задач с правдоподобным распределением сроков.
+
+- задачи по пользователям распределены с длинным хвостом (у большинства 1–20, у немногих сотни);
+- интервалы — типичные значения из /add (5 минут … сутки);
+- сроки в основном в будущем в пределах интервала, небольшая доля уже наступила (бэклог);
+- часть задач выполнена (status=0), часть на паузе, часть пользователей спит.
+
+Схема — та же, что у бота: базу создают миграции app/db/migrations.py.
+"""
+import random
+import shutil
+import sqlite3
+import time
+from pathlib import Path
+
+from app.db import migrations
+
+DATA_DIR = Path(__file__).with_name(".data")
+
+# Не часть схемы бота: когда сгенерирована база (для сдвига сроков в рабочей копии)
+META = "CREATE TABLE IF NOT EXISTS bench_meta (key TEXT PRIMARY KEY, value REAL NOT NULL)"
+
+# (интервал в минутах, вес)
+INTERVALS = [(5, 3), (10, 6), (15, 10), (30, 12), (60, 20), (120, 14), (180, 8), (360, 8), (720, 7), (1440, 12)]
+
+SLEEPING_SHARE = 0.05
+DONE_SHARE = 0.15
+PAUSED_SHARE = 0.03
+OVERDUE_SHARE = 0.005
+
+
+def default_path(users: int, tasks: int) -> Path:
+    return DATA_DIR / f"bench_{users}u_{tasks}t.sqlite"
+
+
+def _tasks_per_user(rng: random.Random, users: int, tasks: int) -> list[int]:
+    # парето даёт длинный хвост; потом масштабируем к нужному итогу
+    weights = [rng.paretovariate(1.3) for _ in range(users)]
+    scale = tasks / sum(weights)
+    counts = [int(w * scale) for w in weights]
+    # остаток раздаём случайным пользователям, чтобы сумма сошлась точно
+    for i in rng.choices(range(users), k=tasks - sum(counts)):
+        counts[i] += 1
+    return counts
+
+
+def generate(path: Path, users: int, tasks: int, seed: int = 1, now: float | None = None) -> Path:
+    """Создаёт базу с нуля; файл появляется под именем path, только если генерация дошла до конца."""
+    rng = random.Random(seed)
+    now = time.time() if now is None else now
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+
+    conn = sqlite3.connect(tmp)
+    migrations.migrate(conn)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute(META)
+    conn.execute("INSERT INTO bench_meta (key, value) VALUES ('generated_at', ?)", (now,))
+
+    conn.executemany(
+        "INSERT INTO users (id, telegram_user_id, username, is_sleeping) VALUES (?, ?, ?, ?)",
+        ((uid, 10_000_000 + uid, f"user{uid}", int(rng.random() < SLEEPING_SHARE))
+         for uid in range(1, users + 1)),
+    )
+
+    intervals = [i for i, _ in INTERVALS]
+    interval_weights = [w for _, w in INTERVALS]
+
+    def rows():
+        for uid, count in enumerate(_tasks_per_user(rng, users, tasks), start=1):
+            for n in range(count):
+                interval = rng.choices(intervals, interval_weights)[0]
+                period = interval * 60
+                if rng.random() < OVERDUE_SHARE:
+                    # пропущенные: до пары периодов назад
+                    due = now - rng.uniform(0, 2 * period)
+                else:
+                    due = now + rng.uniform(0, period)
+                status = 0 if rng.random() < DONE_SHARE else 1
+                paused = now + rng.uniform(0, 3600) if rng.random() < PAUSED_SHARE else None
+                yield uid, f"task {uid}-{n}", None, status, due, interval, paused
+
+    batch = []
+    for row in rows():
+        batch.append(row)
+        if len(batch) >= 50_000:
+            _insert_tasks(conn, batch)
+            batch.clear()
+    _insert_tasks(conn, batch)
+    # задачи спящих запаркованы, как после repo.set_sleep_state
+    conn.execute("""
+        UPDATE tasks SET parked = 1
+        WHERE status = 1 AND user_id IN (SELECT id FROM users WHERE is_sleeping = 1)
+    """)
+
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    tmp.replace(path)
+    return path
+
+
+def _insert_tasks(conn, batch) -> None:
+    conn.executemany("""
+        INSERT INTO tasks (user_id, task_name, task_note, status, next_reminder_at, interval, paused_until)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, batch)
+
+
+def ensure(users: int, tasks: int, path: Path | None = None, seed: int = 1, fresh: bool = False) -> Path:
+    """Путь к шаблонной базе нужного размера; генерирует её, если файла нет (или fresh=True)."""
+    path = path or default_path(users, tasks)
+    if fresh or not path.exists():
+        generate(path, users, tasks, seed=seed)
+    return path
+
+
+def working_copy(template: Path) -> Path:
+    """
+    Копия шаблона для одного прогона (бенчмарк пишет в базу) со сроками, сдвинутыми на «сейчас»:
+    иначе чем старше шаблон, тем больше задач в нём уже наступило.
+    """
+    work = template.with_name(template.stem + ".work.sqlite")
+    for stale in (work.with_name(work.name + "-wal"), work.with_name(work.name + "-shm")):
+        stale.unlink(missing_ok=True)
+    shutil.copyfile(template, work)
+    conn = sqlite3.connect(work)
+    # шаблон мог быть сгенерирован при более старой схеме
+    migrations.migrate(conn)
+    (generated_at,) = conn.execute("SELECT value FROM bench_meta WHERE key = 'generated_at'").fetchone()
+    shift = time.time() - generated_at
+    conn.execute("""
+        UPDATE tasks
+        SET next_reminder_at = next_reminder_at + ?,
+            paused_until = paused_until + ?
+    """, (shift, shift))
+    conn.commit()
+    conn.close()
+    return work
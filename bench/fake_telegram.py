@@ -0,0 +1,196 @@
+# bench/fake_telegram.py
+"""
+Локальная заглушка Telegram Bot API для нагрузочных прогонов: настоящий aiogram.Bot
+ходит сюда вместо api.telegram.org (см. TELEGRAM_API_URL в main.py).
+
+Умеет sendMessage, editMessageText, answerCallbackQuery (+ getMe, deleteWebhook, sendChatAction —
+чтобы бот стартовал и хендлеры с ChatActionSender не зависали).
+Настраивается задержка ответа, доля ошибок 5xx, доля случайных 429 и лимиты,
+которые заглушка сама соблюдает, как Telegram: не больше per_chat_rate сообщений в секунду в один чат
+и global_rate в секунду на бота — сверх этого отвечает 429 с retry_after.
+
+Отдельно: python -m bench.fake_telegram --port 8081 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+
+_SEND_METHODS = {"sendmessage", "editmessagetext"}
+
+
+class FakeTelegram:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        retry_after_rate: float = 0.0,
+        retry_after: int = 1,
+        per_chat_rate: float = 1.0,
+        global_rate: float = 30.0,
+        seed: int | None = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.per_chat_rate = per_chat_rate
+        self.global_rate = global_rate
+        self._rng = random.Random(seed)
+        self._chat_last: dict[int, float] = {}
+        self._global_window: deque[float] = deque()
+        self._message_id = 0
+        self.calls: Counter = Counter()
+        self.responses: Counter = Counter()
+        # (время приёма, chat_id, text) всех принятых sendMessage
+        self.delivered: list[tuple[float, int, str]] = []
+        self._runner: web.AppRunner | None = None
+
+    # ---- приложение ----
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> str:
+        """Поднимает сервер; возвращает базовый URL для TELEGRAM_API_URL."""
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # ---- лимиты ----
+    def _wait_needed(self, chat_id: int | None, now: float) -> float:
+        """Сколько секунд ещё ждать, чтобы не превысить лимиты; 0 — можно отправлять."""
+        window = self._global_window
+        while window and window[0] <= now - 1.0:
+            window.popleft()
+        wait = 0.0
+        if len(window) >= self.global_rate:
+            wait = window[0] + 1.0 - now
+        if chat_id is not None:
+            last = self._chat_last.get(chat_id)
+            if last is not None:
+                wait = max(wait, last + 1.0 / self.per_chat_rate - now)
+        return wait
+
+    def _consume(self, chat_id: int | None, now: float) -> None:
+        self._global_window.append(now)
+        if chat_id is not None:
+            self._chat_last[chat_id] = now
+
+    # ---- ответы ----
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    def _error(self, code: int, description: str, retry_after: int | None = None) -> web.Response:
+        self.responses[code] += 1
+        body = {"ok": False, "error_code": code, "description": description}
+        if retry_after is not None:
+            body["parameters"] = {"retry_after": retry_after}
+        return web.json_response(body, status=code)
+
+    def _message(self, chat_id, text, message_id=None) -> dict:
+        if message_id is None:
+            self._message_id += 1
+            message_id = self._message_id
+        return {
+            "message_id": int(message_id),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "text": text,
+        }
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        params = dict(await request.post())
+        if not params and request.can_read_body:
+            try:
+                params = await request.json()
+            except ValueError:
+                params = {}
+
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if method == "getme":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"})
+        if method in ("deletewebhook", "setwebhook", "setmycommands", "sendchataction"):
+            return self._ok(True)
+        if method == "getupdates":
+            # long polling: апдейтов нет никогда
+            await asyncio.sleep(min(float(params.get("timeout") or 0), 1.0))
+            return self._ok([])
+
+        if self.error_rate and self._rng.random() < self.error_rate:
+            return self._error(500, "Internal Server Error")
+        if self.retry_after_rate and self._rng.random() < self.retry_after_rate:
+            return self._error(429, f"Too Many Requests: retry after {self.retry_after}", self.retry_after)
+
+        if method == "answercallbackquery":
+            self.responses[200] += 1
+            return self._ok(True)
+        if method not in _SEND_METHODS:
+            return self._error(404, "Not Found: method not found")
+
+        chat_id = int(params["chat_id"]) if "chat_id" in params else None
+        now = time.monotonic()
+        wait = self._wait_needed(chat_id, now)
+        if wait > 0:
+            retry_after = max(1, math.ceil(wait))
+            return self._error(429, f"Too Many Requests: retry after {retry_after}", retry_after)
+        self._consume(chat_id, now)
+        self.responses[200] += 1
+
+        text = params.get("text", "")
+        if method == "sendmessage":
+            self.delivered.append((time.time(), chat_id, text))
+            return self._ok(self._message(chat_id, text))
+        return self._ok(self._message(chat_id, text, params.get("message_id")))
+
+    def stats(self) -> dict:
+        return {
+            "calls": dict(self.calls),
+            "responses": {str(k): v for k, v in self.responses.items()},
+            "delivered": len(self.delivered),
+        }
+
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Заглушка Telegram Bot API")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8081)
+    p.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    p.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, сек")
+    p.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    p.add_argument("--retry-after-rate", type=float, default=0.0, help="доля случайных 429")
+    p.add_argument("--retry-after", type=int, default=1)
+    p.add_argument("--per-chat-rate", type=float, default=1.0)
+    p.add_argument("--global-rate", type=float, default=30.0)
+    args = p.parse_args(argv)
+
+    fake = FakeTelegram(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        retry_after_rate=args.retry_after_rate, retry_after=args.retry_after,
+        per_chat_rate=args.per_chat_rate, global_rate=args.global_rate,
+    )
+    web.run_app(fake.make_app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
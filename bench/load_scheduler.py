@@ -0,0 +1,176 @@
+# bench/load_scheduler.py
+"""
+Сквозной нагрузочный прогон: настоящий планировщик + настоящий aiogram.Bot (main.create_bot)
+против локальной заглушки Bot API (bench/fake_telegram.py) на синтетической базе.
+
+    python -m bench.load_scheduler --users 20000 --tasks 1000000 --backlog 5000 --duration 60
+
+--backlog делает указанное число активных задач наступившими прямо перед стартом (как после простоя).
+Отчёт (JSON): напоминаний в секунду и опоздание p50/p99/max — время приёма заглушкой минус срок задачи,
+а для задач, наступивших ещё до старта, минус момент старта (иначе старый бэклог базы заслонит всё);
+плюс ответы заглушки (сколько было 429 и 5xx).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from app.db import repo
+from app.services.delivery import GLOBAL_RATE
+from app.services.scheduler import run as scheduler_run
+from bench import dataset
+from bench.bench_repo import summarize
+from bench.fake_telegram import FakeTelegram
+
+FAKE_TOKEN = "123456:LOAD-TEST"
+
+_NAME_RE = re.compile(r"<b>(.*?)</b>", re.S)
+
+
+def make_backlog(db_path: Path, count: int, seed: int) -> None:
+    """count случайных активных задач неспящих пользователей становятся наступившими (до минуты назад)."""
+    if count <= 0:
+        return
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        UPDATE tasks
+        SET next_reminder_at = ? - abs(random() % 60000) / 1000.0, paused_until = NULL
+        WHERE id IN (
+            SELECT id FROM tasks
+            WHERE status = 1
+              AND user_id NOT IN (SELECT id FROM users WHERE is_sleeping = 1)
+            ORDER BY (id * ?) % 1000003
+            LIMIT ?
+        )
+    """, (time.time(), seed * 7919 + 1, count))
+    conn.commit()
+    conn.close()
+
+
+def due_snapshot(db_path: Path, until: float) -> dict[str, float]:
+    """task_name -> срок для всего, что должно уйти за время прогона."""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("""
+        SELECT t.task_name, MAX(t.next_reminder_at, COALESCE(t.paused_until, 0))
+        FROM tasks t
+        JOIN users u ON u.id = t.user_id
+        WHERE t.status = 1 AND u.is_sleeping = 0
+          AND MAX(t.next_reminder_at, COALESCE(t.paused_until, 0)) <= ?
+    """, (until,)).fetchall()
+    conn.close()
+    return dict(rows)
+
+
+async def run_load(args, db_path: Path) -> dict:
+    fake = FakeTelegram(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        retry_after_rate=args.retry_after_rate, retry_after=args.retry_after,
+        per_chat_rate=args.server_per_chat_rate, global_rate=args.server_global_rate,
+        seed=args.seed,
+    )
+    os.environ["TELEGRAM_API_URL"] = await fake.start(port=args.port)
+
+    # main импортируем после настройки окружения: create_bot читает TELEGRAM_API_URL
+    from main import create_bot
+
+    started = time.time()
+    expected = due_snapshot(db_path, started + args.duration)
+    bot = create_bot(FAKE_TOKEN)
+    scheduler = asyncio.create_task(scheduler_run(
+        bot, interval_seconds=args.interval, batch_limit=args.batch_limit, quiet=True,
+        concurrency=args.concurrency, global_rate=args.global_rate, mode=args.mode, adaptive=True,
+    ))
+    try:
+        await asyncio.sleep(args.duration)
+    finally:
+        scheduler.cancel()
+        await asyncio.gather(scheduler, return_exceptions=True)
+        await bot.session.close()
+        await fake.stop()
+    elapsed = time.time() - started
+
+    lateness = []
+    seen = set()
+    for received_at, _chat_id, text in fake.delivered:
+        m = _NAME_RE.search(text)
+        name = m.group(1) if m else None
+        if name in expected and name not in seen:
+            seen.add(name)
+            lateness.append(max(0.0, received_at - max(expected[name], started)))
+
+    delivered = len(fake.delivered)
+    report = {
+        "delivered": delivered,
+        "reminders_per_sec": round(delivered / elapsed, 2),
+        "expected_due": len(expected),
+        "not_delivered": len(expected) - len(seen),
+        "server": fake.stats(),
+    }
+    if lateness:
+        # summarize считает в мс — для опоздания удобнее секунды
+        lat = summarize(lateness)
+        report["lateness_s"] = {
+            "n": lat["n"],
+            "p50": round(lat["p50_ms"] / 1000, 3),
+            "p99": round(lat["p99_ms"] / 1000, 3),
+            "max": round(lat["max_ms"] / 1000, 3),
+            "mean": round(lat["mean_ms"] / 1000, 3),
+        }
+    return report
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--users", type=int, default=10_000)
+    p.add_argument("--tasks", type=int, default=500_000)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--db", type=Path, help="шаблонная база (по умолчанию из bench/dataset.py)")
+    p.add_argument("--backlog", type=int, default=1000, help="сколько задач сделать наступившими перед стартом")
+    p.add_argument("--duration", type=float, default=30.0, help="длительность прогона, сек")
+    p.add_argument("--mode", choices=("poll", "heap"), default="poll")
+    p.add_argument("--interval", type=int, default=15, help="интервал тика планировщика (poll), сек")
+    p.add_argument("--batch-limit", type=int, default=50)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--global-rate", type=float, default=GLOBAL_RATE, help="глобальный лимит на стороне бота")
+    p.add_argument("--port", type=int, default=8081)
+    p.add_argument("--latency", type=float, default=0.03, help="задержка ответа заглушки, сек")
+    p.add_argument("--jitter", type=float, default=0.02)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--retry-after-rate", type=float, default=0.0)
+    p.add_argument("--retry-after", type=int, default=1)
+    p.add_argument("--server-per-chat-rate", type=float, default=1.0)
+    p.add_argument("--server-global-rate", type=float, default=30.0)
+    p.add_argument("--out", type=Path, help="куда записать JSON (иначе stdout)")
+    p.add_argument("--verbose", action="store_true", help="не глушить логи отправки (трейсбеки 429/5xx)")
+    args = p.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    template = dataset.ensure(args.users, args.tasks, path=args.db, seed=args.seed)
+    work = dataset.working_copy(template)
+    make_backlog(work, args.backlog, args.seed)
+
+    repo.close_pool()
+    repo.DB_PATH = work
+    try:
+        report = asyncio.run(run_load(args, work))
+    finally:
+        repo.close_pool()
+
+    report["meta"] = {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        args.out.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
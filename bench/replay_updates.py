@@ -0,0 +1,111 @@
+# bench/replay_updates.py
+"""
+Прогон записанных апдейтов через webhook-режим (BOT_MODE=webhook) локально:
+
+    python -m bench.replay_updates bench/updates_sample.jsonl --url http://127.0.0.1:8080/webhook --repeat 100
+
+Файл — JSONL, по одному объекту Update на строку. update_id перенумеровывается по порядку,
+--users размножает апдейты на разных пользователей (from.id / chat.id сдвигаются на номер копии),
+чтобы прогон не упирался в одного пользователя. Ответы бота при этом уходят туда, куда смотрит
+TELEGRAM_API_URL, — удобно вместе с bench/fake_telegram.py.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import aiohttp
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def load_updates(path: Path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+def _shift_ids(update: dict, offset: int) -> dict:
+    if not offset:
+        return update
+    update = copy.deepcopy(update)
+    for key in ("message", "edited_message", "callback_query"):
+        obj = update.get(key)
+        if not obj:
+            continue
+        if "from" in obj:
+            obj["from"]["id"] += offset
+        chat = obj.get("chat") or (obj.get("message") or {}).get("chat")
+        if chat:
+            chat["id"] += offset
+    return update
+
+
+def build_stream(updates: list[dict], repeat: int, users: int):
+    update_id = 0
+    for _ in range(repeat):
+        for copy_no in range(users):
+            for update in updates:
+                update_id += 1
+                out = _shift_ids(update, copy_no * 1_000_000)
+                out = dict(out, update_id=update_id)
+                yield out
+
+
+async def replay(url: str, stream, concurrency: int, secret: str | None) -> dict:
+    headers = {SECRET_HEADER: secret} if secret else {}
+    statuses: Counter = Counter()
+    sent = 0
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def worker(session):
+        nonlocal sent
+        while True:
+            update = await queue.get()
+            try:
+                async with session.post(url, json=update, headers=headers) as resp:
+                    statuses[resp.status] += 1
+            except aiohttp.ClientError as e:
+                statuses[type(e).__name__] += 1
+            finally:
+                sent += 1
+                queue.task_done()
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        workers = [asyncio.create_task(worker(session)) for _ in range(concurrency)]
+        for update in stream:
+            await queue.put(update)
+        await queue.join()
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    return {
+        "posted": sent,
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(sent / elapsed, 1) if elapsed else None,
+        "statuses": {str(k): v for k, v in statuses.items()},
+    }
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("updates", type=Path, help="JSONL с апдейтами")
+    p.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    p.add_argument("--secret", help="WEBHOOK_SECRET бота")
+    p.add_argument("--repeat", type=int, default=1)
+    p.add_argument("--users", type=int, default=1, help="сколько пользователей-копий")
+    p.add_argument("--concurrency", type=int, default=16, help="одновременных POST")
+    args = p.parse_args(argv)
+
+    stream = build_stream(load_updates(args.updates), args.repeat, args.users)
+    report = asyncio.run(replay(args.url, stream, args.concurrency, args.secret))
+    print(json.dumps(report, indent=2))
+    return 0 if set(report["statuses"]) <= {"200"} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,9 +7,30 @@ from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
-from app.handlers import add, list as list_handlers, sleep
+from app.db import async_repo
+from app.db.fsm_storage import SqliteStorage
+from app.handlers import add, callbacks, import_tasks, list as list_handlers, settings, sleep, start
+from app.middlewares.user import UserMiddleware
+from app.services import archiver, metrics
+from app.services.delivery import CATCHUP_POLICIES
 from app.services.scheduler import run as scheduler_run
+from app.webhook import run_webhook
+
+
+def create_bot(token: str) -> Bot:
+    # TELEGRAM_API_URL — свой Bot API server вместо api.telegram.org
+    # (локальный telegram-bot-api или заглушка bench/fake_telegram.py для нагрузочных прогонов)
+    api_url = os.getenv("TELEGRAM_API_URL")
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+    return Bot(
+        token=token,
+        session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+
 
 async def main():
     # --- логирование ---
@@ -22,30 +43,108 @@ async def main():
     if not BOT_TOKEN or ":" not in BOT_TOKEN:
         raise RuntimeError("❌ BOT_TOKEN не найден или неверный. Проверь .env")
 
+    # BOT_MODE=polling (по умолчанию) или webhook (см. app/webhook.py и WEBHOOK_* ниже)
+    bot_mode = os.getenv("BOT_MODE", "polling")
+    if bot_mode not in ("polling", "webhook"):
+        raise RuntimeError(f"❌ Неизвестный BOT_MODE: {bot_mode} (polling | webhook)")
+
+    # CATCHUP_POLICY: summary (по умолчанию) — по пропущенным за время простоя срокам одно напоминание
+    # с их числом, skip — пропущенные сроки молча пропустить
+    catch_up = os.getenv("CATCHUP_POLICY", "summary")
+    if catch_up not in CATCHUP_POLICIES:
+        raise RuntimeError(f"❌ Неизвестный CATCHUP_POLICY: {catch_up} ({' | '.join(CATCHUP_POLICIES)})")
+
+    # --- схема БД: применяем недостающие миграции (app/db/migrations.py) ---
+    applied = await async_repo.migrate()
+    if applied:
+        logging.info("Применены миграции БД: %s", applied)
+
     # --- инициализация бота и диспетчера ---
-    bot = Bot(
-        token=BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    bot = create_bot(BOT_TOKEN)
+    # FSM (/add) в SQLite: диалоги переживают рестарт, брошенные выметаются через FSM_TTL секунд,
+    # в памяти не больше FSM_CACHE_SIZE ключей
+    storage = SqliteStorage(
+        ttl_seconds=float(os.getenv("FSM_TTL", str(24 * 3600))),
+        max_cached=int(os.getenv("FSM_CACHE_SIZE", "10000")),
     )
-    dp = Dispatcher()
+    dp = Dispatcher(storage=storage)
+
+    # --- пользователь резолвится один раз на апдейт (с кэшем) ---
+    user_middleware = UserMiddleware()
+    dp.message.outer_middleware(user_middleware)
+    dp.callback_query.outer_middleware(user_middleware)
 
     # --- подключаем роутеры ---
+    dp.include_router(start.router)
     dp.include_router(add.form_router)
     dp.include_router(list_handlers.router)
+    # все инлайн-кнопки — одна точка входа с диспетчеризацией по коду действия
+    dp.include_router(callbacks.router)
     dp.include_router(sleep.router)
+    dp.include_router(settings.router)
+    # последним: в ожидании списка для /import другие команды должны срабатывать как обычно
+    dp.include_router(import_tasks.router)
 
     # --- запускаем фоновый планировщик напоминаний ---
-    asyncio.create_task(scheduler_run(bot, interval_seconds=15, batch_limit=50, quiet=False))
+    # SCHEDULER_MODE=heap — спать до ближайшего срока вместо опроса БД раз в 15 секунд
+    scheduler_mode = os.getenv("SCHEDULER_MODE", "poll")
+    # adaptive: полный батч — сразу следующий, размер батча подстраивается под бэклог
+    # Процессов на одной базе может быть несколько: строки захватываются на SCHEDULER_WORKER_ID
+    # (по умолчанию хост:pid:хвост) на SCHEDULER_LEASE_SECONDS, дублей между процессами не будет
+    scheduler = scheduler_run(bot, interval_seconds=15, batch_limit=50, quiet=False,
+                              concurrency=8, mode=scheduler_mode, adaptive=True,
+                              worker_id=os.getenv("SCHEDULER_WORKER_ID") or None,
+                              lease_seconds=float(os.getenv("SCHEDULER_LEASE_SECONDS", "60")),
+                              catch_up=catch_up)
+    # ссылки держим: при остановке их надо отменить и дождаться до закрытия пула БД
+    background = [asyncio.create_task(scheduler, name="scheduler")]
 
-    logging.info("✅ Бот запущен и ждёт события")
+    # --- архивация закрытых задач раз в ARCHIVE_INTERVAL секунд (0 — выключить) ---
+    archive_interval = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+    if archive_interval > 0:
+        background.append(asyncio.create_task(archiver.run(interval_seconds=archive_interval, quiet=False),
+                                              name="archiver"))
 
-    # --- стартуем polling ---
+    metrics_runner = None
     try:
-        await dp.start_polling(bot)
+        # --- /metrics для Prometheus: METRICS_PORT (по умолчанию выключен) ---
+        # порт может быть занят (второй процесс бота на той же машине) — тогда работаем без /metrics
+        metrics_port = int(os.getenv("METRICS_PORT", "0"))
+        if metrics_port:
+            try:
+                metrics_runner = await metrics.start_server(os.getenv("METRICS_HOST", "127.0.0.1"), metrics_port)
+            except OSError as e:
+                logging.warning("/metrics не поднят на порту %s: %s", metrics_port, e)
+
+        logging.info("✅ Бот запущен и ждёт события")
+
+        # --- приём апдейтов ---
+        if bot_mode == "webhook":
+            await run_webhook(
+                dp, bot,
+                host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+                port=int(os.getenv("WEBHOOK_PORT", "8080")),
+                path=os.getenv("WEBHOOK_PATH", "/webhook"),
+                concurrency=int(os.getenv("WEBHOOK_CONCURRENCY", "32")),
+                secret=os.getenv("WEBHOOK_SECRET") or None,
+                public_url=os.getenv("WEBHOOK_URL") or None,
+            )
+        else:
+            await dp.start_polling(bot)
     except Exception as e:
-        logging.exception("Polling упал с ошибкой: %s", e)
+        logging.exception("Приём апдейтов упал с ошибкой: %s", e)
     finally:
+        # сначала фоновые задачи: остановка планировщика (pipeline.stop) ещё пишет итоги отправок в outbox
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        # несброшенные состояния диалогов — в БД до закрытия пула
+        await storage.close()
         await bot.session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        # последним: после закрытия любой вызов async_repo молча поднял бы пул заново
+        async_repo.close()
 
 
 if __name__ == "__main__":